@@ -54,12 +54,20 @@ angles are normalized i.e., [0, 360.0) or [0, 2π) or [0, 24.0). The
 other method normalizes angles in the manner that latitudinal angles
 are normalized i.e., [-90, 90] or [-π/2, π/2].
 
+The functions and classes that work on arrays of values, such as
+`normalize_array`, `sep_array` and `AngularPositionArray`, need NumPy.
+NumPy is imported only when one of these is first used, so importing
+this module does not need NumPy, and stays fast.
+
 See docstrings of classes and functions for documentation and examples.
 
 :author: Prasanth Nair
 :contact: prasanthhn@gmail.com
 :license: BSD (http://www.opensource.org/licenses/bsd-license.php)
 """
+import contextlib
+import os
+import time
 import warnings
 import math
 import re
@@ -67,6 +75,18 @@ import re
 __version__ = "2.0"
 
 
+def _numpy():
+    # NumPy is needed only by the functions and classes that work on
+    # arrays. It is imported when one of these is first used, so that
+    # "import angles" stays fast, and works without NumPy.
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("NumPy is needed for this function; the scalar "
+                          "functions and classes in angles do not need it.")
+    return numpy
+
+
 def r2d(r):
     """Convert radians into degrees."""
     return math.degrees(r)
@@ -77,6 +97,12 @@ def d2r(d):
     return math.radians(d)
 
 
+# The z-axis, with components exactly as in
+# CartesianVector.from_spherical(1.0, 0.0, d2r(90.0)).
+_Z_AXIS = (math.cos(d2r(90.0)) * math.cos(0.0),
+           math.cos(d2r(90.0)) * math.sin(0.0), math.sin(d2r(90.0)))
+
+
 def h2d(h):
     """Convert hours into degrees."""
     return h * 15.0
@@ -251,6 +277,94 @@ def normalize(num, lower=0, upper=360, b=False):
     return res
 
 
+def normalize_array(num, lower=0, upper=360, b=False, out=None):
+    """Normalize an array of numbers to range [lower, upper) or [lower, upper].
+
+    This is the vectorized version of `normalize`. It needs NumPy.
+
+    Parameters
+    ----------
+    num : array_like
+        The numbers to be normalized. Any object that can be converted
+        into a NumPy array of floats, including buffers, is accepted.
+    lower : int
+        Lower limit of range. Default is 0.
+    upper : int
+        Upper limit of range. Default is 360.
+    b : bool
+        Type of normalization. Default is False. See `normalize`.
+    out : numpy.ndarray
+        Optional array of floats, with the same shape as `num`, into
+        which the result is written.
+
+    Returns
+    -------
+    n : numpy.ndarray
+        Array of floats in the range [lower, upper) or [lower,
+        upper]. This is `out` if it was given.
+
+    Raises
+    ------
+    ValueError
+      If lower >= upper, or if the range is not valid for the given
+      type of normalization. See `normalize`.
+
+    Notes
+    -----
+    The range is checked once, and all the values are normalized in a
+    single pass. The results are identical to those from `normalize`.
+
+    See also
+    --------
+    normalize
+
+    Examples
+    --------
+    >>> normalize_array([-270, 180, 181, 368.5], -180, 180).tolist()
+    [90.0, -180.0, -179.0, 8.5]
+    >>> normalize_array([-100, 100, 181, 271], -90, 90, b=True).tolist()
+    [-80.0, 80.0, -1.0, -89.0]
+
+    """
+    np = _numpy()
+
+    if lower >= upper:
+        raise ValueError("lower must be lesser than upper")
+    if not b:
+        if not ((lower + upper == 0) or (lower == 0)):
+            raise ValueError('When b=False lower=0 or range must be symmetric about 0.')
+    else:
+        if not (lower + upper == 0):
+            raise ValueError('When b=True range must be symmetric about 0.')
+
+    num = np.asarray(num, dtype=np.float64)
+
+    # Same steps as in `normalize`, applied to all elements. Each step
+    # uses the result of the previous one.
+    if not b:
+        total_length = abs(lower) + abs(upper)
+        num = np.where((num > upper) | (num == lower),
+                       lower + np.abs(num + upper) % total_length, num)
+        num = np.where((num < lower) | (num == upper),
+                       upper - np.abs(num - lower) % total_length, num)
+        res = np.where(num == upper, float(lower), num)
+    else:
+        total_length = abs(lower) + abs(upper)
+        num = np.where(num < -total_length,
+                       num + np.ceil(num / (-2 * total_length)) * 2 * total_length,
+                       num)
+        num = np.where(num > total_length,
+                       num - np.floor(num / (2 * total_length)) * 2 * total_length,
+                       num)
+        num = np.where(num > upper, total_length - num, num)
+        res = np.where(num < lower, -total_length - num, num)
+
+    if out is None:
+        return res
+    out[...] = res
+    return out
+
+
 def d2d(d):
     """Normalize angle in degree to [0, 360)."""
     return normalize(d, 0, 360)
@@ -267,7 +381,7 @@ def r2r(r):
 
 
 def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
-              b=False, upper_trim=False):
+              b=False, upper_trim=False, exact=False):
     """Returns the sexagesimal representation of a decimal number.
 
     Parameters
@@ -294,6 +408,10 @@ def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
         first part of the sexagesimal number is equal to `upper`, it is
         replaced with `lower` (value used is int(lower)). This converts numbers
         such as "24 00 00.000" to "00 00 00.000". Default value is False.
+    exact : bool
+        If True, and `pre` is not negative, then the rounding or
+        truncation is done on the exact value of `deci`, using integer
+        arithmetic. See notes. Default is False.
 
     Returns
     -------
@@ -325,6 +443,20 @@ def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
     The returned sign, first element of tuple, applies to the whole
     number and not just to a single part.
 
+    By default the parts are found with floating point arithmetic,
+    which rounds the intermediate results. For a number within about
+    1e-16 of a rounding boundary, for example with seconds equal to
+    x.4999999 when `pre` is 6, the result can then be off by one unit in
+    the last place. If `exact` is True, then the number is scaled once
+    into an integer number of 10**-pre seconds, rounded to nearest,
+    with ties to even, or truncated, as decided by the exact value of
+    the float `deci`, and the parts are found by integer division. The
+    rounding error of the scaling is found exactly, with Dekker's
+    two-product, and decides values that lie on a boundary; only very
+    large or very small values, or `pre` above 12, need
+    `fractions.Fraction`. For a negative `pre` the seconds are not a
+    whole number of 10**-pre units and `exact` is ignored.
+
     Examples
     --------
     >>> deci2sexa(-11.2345678)
@@ -357,6 +489,20 @@ def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
     >>> deci2sexa(x, pre=5, lower=0, upper=24, upper_trim=True)
     (1, 23, 59, 59.99999)
 
+    The seconds of the following number are 48.4999999999999...,
+    which the default calculation sees as 48.5 and rounds up. The
+    seconds of the second number are just above 26.3, but truncate to
+    26.2.
+
+    >>> deci2sexa(0.33013888888888887, pre=0)
+    (1, 0, 19, 49.0)
+    >>> deci2sexa(0.33013888888888887, pre=0, exact=True)
+    (1, 0, 19, 48.0)
+    >>> deci2sexa(3.4739722222222222, pre=1, trunc=True)
+    (1, 3, 28, 26.2)
+    >>> deci2sexa(3.4739722222222222, pre=1, trunc=True, exact=True)
+    (1, 3, 28, 26.3)
+
     """
     if lower is not None and upper is not None:
         deci = normalize(deci, lower=lower, upper=upper, b=b)
@@ -366,27 +512,31 @@ def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
         deci = abs(deci)
         sign = -1
 
-    hd, f1 = divmod(deci, 1)
-    mm, f2 = divmod(f1 * 60.0, 1)
-    sf = f2 * 60.0
-
-    # Find the seconds part to required precision.
     fp = 10 ** pre
-    if trunc:
-        ss, _ = divmod(sf * fp, 1)
+    if exact and pre >= 0:
+        hd, ss = divmod(_sexa_units(deci, pre, trunc), 3600 * fp)
+        mm, ss = divmod(ss, 60 * fp)
     else:
-        ss = round(sf * fp, 0)
+        hd, f1 = divmod(deci, 1)
+        mm, f2 = divmod(f1 * 60.0, 1)
+        sf = f2 * 60.0
+
+        # Find the seconds part to required precision.
+        if trunc:
+            ss, _ = divmod(sf * fp, 1)
+        else:
+            ss = round(sf * fp, 0)
 
-    ss = int(ss)
+        ss = int(ss)
 
-    # If ss is 60 to given precision then update mm, and if necessary
-    # hd.
-    if ss == 60 * fp:
-        mm += 1
-        ss = 0
-    if mm == 60:
-        hd += 1
-        mm = 0
+        # If ss is 60 to given precision then update mm, and if
+        # necessary hd.
+        if ss == 60 * fp:
+            mm += 1
+            ss = 0
+        if mm == 60:
+            hd += 1
+            mm = 0
 
     hd = int(hd)
     mm = int(mm)
@@ -403,6 +553,210 @@ def deci2sexa(deci, pre=3, trunc=False, lower=None, upper=None,
     return (sign, hd, mm, ss)
 
 
+def _sexa_units(deci, pre, trunc):
+    # Number of 10**-pre seconds in deci hours or degrees, for deci >= 0
+    # and pre >= 0, truncated or rounded half to even from the exact
+    # value of the float deci.
+    return _scale_int(deci, 3600 * 10 ** pre, trunc)
+
+
+def _product_error(a, b, x):
+    # The exact error a * b - x of the product x = a * b, using Dekker's
+    # splitting of a and b into halves of 26 bits; this also works on
+    # arrays. The products must neither overflow nor underflow.
+    c = 134217729.0 * a
+    ah = c - (c - a)
+    al = a - ah
+    c = 134217729.0 * b
+    bh = c - (c - b)
+    bl = b - bh
+    return ((ah * bh - x) + ah * bl + al * bh) + al * bl
+
+
+def _scale_int(deci, scale, trunc=False):
+    # deci * scale, for deci >= 0 and integer scale, truncated or
+    # rounded half to even from the exact value of the float deci. The
+    # exact product is x + e, where x is the float product and e its
+    # error. The fractional part f of x is a multiple of the spacing of
+    # floats at x, which is larger than |e|, so only f and the sign of
+    # e are needed: for truncation e matters only if f is 0, and for
+    # rounding only if f is 0.5. Very small and very large products
+    # use rational arithmetic.
+    if scale < 2 ** 53 and deci > 2.0 ** -900:
+        x = deci * float(scale)
+        if x < 2.0 ** 52:
+            n = int(math.floor(x))
+            f = x - n
+            if trunc:
+                if f != 0:
+                    return n
+                return n - (_product_error(deci, float(scale), x) < 0)
+            if f != 0.5:
+                return n + (f > 0.5)
+            e = _product_error(deci, float(scale), x)
+            return n + (e > 0 or (e == 0 and n % 2 == 1))
+    if deci == 0:
+        return 0
+    # The rounding is done here, since math.floor and round do not
+    # return ints, and round does not round half to even, in Python 2.
+    from fractions import Fraction
+    q = Fraction(deci) * scale
+    n, r = divmod(q.numerator, q.denominator)
+    if not trunc and (2 * r > q.denominator or
+                      (2 * r == q.denominator and n % 2)):
+        n += 1
+    return int(n)
+
+
+def _sexa_units_array(deci, pre, trunc):
+    # _sexa_units for an array of non-negative numbers, as int64, or as
+    # Python ints if the counts may not fit in int64. The same steps as
+    # in _scale_int, on all values together.
+    np = _numpy()
+
+    scale = 3600 * 10 ** pre
+    x = deci * float(scale)
+    n = np.floor(x)
+    f = x - n
+    slow = ~(x < 2.0 ** 52) | ((deci <= 2.0 ** -900) & (deci != 0))
+    if scale >= 2 ** 53:
+        slow[...] = True
+    else:
+        with np.errstate(invalid="ignore", over="ignore"):
+            e = _product_error(deci, float(scale), x)
+        if trunc:
+            n -= (f == 0) & (e < 0)
+        else:
+            n += (f > 0.5) | ((f == 0.5) & ((e > 0) | ((e == 0) & (n % 2 == 1))))
+    n = np.where(slow, 0.0, n).astype(np.int64)
+    if (x >= 2.0 ** 62).any():
+        n = n.astype(object)
+    for i in np.flatnonzero(slow):
+        n.flat[i] = _sexa_units(float(deci.flat[i]), pre, trunc)
+    return n
+
+
+# Structured data type of the array returned by `deci2sexa_array`.
+SEXA_DTYPE = [("sign", "i1"), ("hd", "i8"), ("mm", "i8"), ("ss", "f8")]
+
+
+def deci2sexa_array(deci, pre=3, trunc=False, lower=None, upper=None,
+                    b=False, upper_trim=False, exact=False):
+    """Returns the sexagesimal representation of an array of numbers.
+
+    This is the vectorized version of `deci2sexa`. It needs NumPy.
+
+    Parameters
+    ----------
+    deci : array_like
+        Decimal numbers to be converted into sexagesimal.
+    pre, trunc, lower, upper, b, upper_trim, exact
+        Same as for `deci2sexa`.
+
+    Returns
+    -------
+    s : numpy.ndarray
+        Structured array, with the same shape as `deci`, of data type
+        `SEXA_DTYPE`. The fields ``sign``, ``hd``, ``mm`` and ``ss``
+        are the four elements of the tuple returned by `deci2sexa`.
+
+    Raises
+    ------
+    ValueError
+        If any value is not finite, or, after normalization, is 2**62
+        or more in magnitude, since the first part is stored as int64.
+
+    Notes
+    -----
+    All values are processed together, including the carry from 60
+    seconds into minutes and from 60 minutes into the first part, and
+    the replacement of `upper` with `lower` when `upper_trim` is
+    True. The results are identical to those from `deci2sexa`.
+
+    See also
+    --------
+    deci2sexa
+
+    Examples
+    --------
+    >>> x = 23+59/60.0+59.99999/3600.0
+    >>> s = deci2sexa_array([-11.2345678, x, x], pre=3, lower=0, upper=24,
+    ...                     upper_trim=True)
+    >>> [tuple(i) for i in s.tolist()]
+    [(1, 12, 45, 55.556), (1, 0, 0, 0.0), (1, 0, 0, 0.0)]
+    >>> s = deci2sexa_array([-11.2345678, x])
+    >>> s['sign'].tolist(), s['hd'].tolist(), s['ss'].tolist()
+    ([-1, 1], [11, 24], [4.444, 0.0])
+
+    """
+    np = _numpy()
+
+    sign, hd, mm, ss = _deci2sexa_parts(deci, pre, trunc, lower, upper, b,
+                                        upper_trim, exact)
+    s = np.empty(sign.shape, dtype=SEXA_DTYPE)
+    s['sign'] = sign
+    s['hd'] = hd
+    s['mm'] = mm
+    s['ss'] = ss / float(10 ** pre)
+    return s
+
+
+def _deci2sexa_parts(deci, pre, trunc, lower, upper, b, upper_trim,
+                     exact=False):
+    # Sign, first part, minutes and seconds, for an array of numbers,
+    # using the same steps as deci2sexa. The seconds are returned as
+    # an array of integer valued floats, in units of 10**-pre.
+    np = _numpy()
+
+    deci = np.asarray(deci, dtype=np.float64)
+    if not np.isfinite(deci).all():
+        raise ValueError("Values must be finite.")
+    if lower is not None and upper is not None:
+        deci = normalize_array(deci, lower=lower, upper=upper, b=b)
+    # The first part must fit in an int64, with room for the carry.
+    if not (np.abs(deci) < 2.0 ** 62).all():
+        raise ValueError("Values must be smaller than 2**62 in magnitude.")
+
+    sign = np.where(deci < 0, -1, 1)
+    deci = np.abs(deci)
+
+    fp = 10 ** pre
+    if exact and pre >= 0:
+        n = _sexa_units_array(deci, pre, trunc)
+        hd, ss = n // (3600 * fp), n % (3600 * fp)
+        mm, ss = ss // (60 * fp), ss % (60 * fp)
+        ss = ss.astype(np.float64)
+    else:
+        hd, f1 = np.divmod(deci, 1)
+        mm, f2 = np.divmod(f1 * 60.0, 1)
+        sf = f2 * 60.0
+
+        # Find the seconds part to required precision.
+        if trunc:
+            ss = np.floor_divide(sf * fp, 1)
+        else:
+            ss = np.round(sf * fp)
+
+        # If ss is 60 to given precision then update mm, and if
+        # necessary hd.
+        carry = ss == 60 * fp
+        mm = np.where(carry, mm + 1, mm)
+        ss = np.where(carry, 0.0, ss)
+        carry = mm == 60
+        hd = np.where(carry, hd + 1, hd)
+        mm = np.where(carry, 0.0, mm)
+
+    hd = hd.astype(np.int64)
+    mm = mm.astype(np.int64)
+    if lower is not None and upper is not None and upper_trim:
+        # For example 24h0m0s => 0h0m0s.
+        hd = np.where(hd == upper, int(lower), hd)
+
+    sign = np.where((hd == 0) & (mm == 0) & (ss == 0), 1, sign)
+
+    return sign, hd, mm, ss
+
+
 def sexa2deci(sign, hd, mm, ss, todeg=False):
     """Combine sexagesimal components into a decimal number.
 
@@ -477,8 +831,70 @@ def sexa2deci(sign, hd, mm, ss, todeg=False):
     return d
 
 
+def sexa2deci_array(sign, hd, mm, ss, todeg=False):
+    """Combine arrays of sexagesimal components into decimal numbers.
+
+    This is the vectorized version of `sexa2deci`. It needs NumPy.
+
+    Parameters
+    ----------
+    sign : array_like
+        Sign of the numbers: 1 for +ve, -1 for negative.
+    hd : array_like
+        The hour or degree like parts.
+    mm : array_like
+        The minute or arc-minute like parts.
+    ss : array_like
+        The second or arc-second like parts.
+    todeg : bool
+        If True then convert to degrees, assuming that the input values
+        are in hours. Default is False.
+
+    Returns
+    -------
+    d : numpy.ndarray
+        The decimal equivalents of the sexagesimal numbers. The inputs
+        are broadcast against each other.
+
+    Notes
+    -----
+    Unlike `sexa2deci`, an invalid sign does not raise an exception.
+    Signs are checked for all rows at once, and the value for a row
+    with a sign other than -1 or 1 is NaN. Other values are identical
+    to those from `sexa2deci`.
+
+    See also
+    --------
+    sexa2deci
+
+    Examples
+    --------
+    >>> sexa2deci_array([1, -1, 0], [12, 12, 12], 0, 0.0).tolist()
+    [12.0, -12.0, nan]
+    >>> sexa2deci_array(1, [12, 11], [0, 30], [0.0, 27.0], todeg=True).tolist()
+    [180.0, 172.6125]
+
+    """
+    np = _numpy()
+
+    sign = np.asarray(sign)
+    valid = (sign == 1) | (sign == -1)
+
+    d = 0.0 + np.asarray(hd) / 1.0
+    d = d + np.asarray(mm) / 60.0
+    d = d + np.asarray(ss) / 3600.0
+
+    # Add proper sign.
+    d = d * sign
+
+    if todeg:
+        d = d * 15.0
+
+    return np.where(valid, d, np.nan)
+
+
 def fmt_angle(val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
-              lower=None, upper=None, b=False, upper_trim=False):
+              lower=None, upper=None, b=False, upper_trim=False, exact=False):
     """Return sexagesimal string of given angle in degrees or hours.
 
     Parameters
@@ -513,6 +929,9 @@ def fmt_angle(val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
         sexagesimal number equals `upper`, it is replaced with
         `lower`. For examples, "12 00 00" gets turned into "00 00
         00".
+    exact : bool
+        If True then the rounding or truncation is decided by the exact
+        value of `val`. See `deci2sexa`.
 
     See also
     --------
@@ -542,7 +961,7 @@ def fmt_angle(val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
 
     """
     x = deci2sexa(val, pre=pre, trunc=trunc, lower=lower, upper=upper,
-                  upper_trim=upper_trim, b=b)
+                  upper_trim=upper_trim, b=b, exact=exact)
 
     left_digits_plus_deci_point = 3 if pre > 0 else 2
     p = "{3:0" + "{0}.{1}".format(pre + left_digits_plus_deci_point, pre) + "f}" + s3
@@ -551,6 +970,290 @@ def fmt_angle(val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
     return p.format("-" if x[0] < 0 else "+", *x[1:])
 
 
+def _digits(buf, col, n, width):
+    # Write the integer array `n` as `width` zero padded ASCII digits,
+    # into columns `col` onwards of the uint8 array `buf`.
+    for k in range(width):
+        buf[:, col + width - 1 - k] = 48 + (n // 10 ** k) % 10
+
+
+def fmt_angle_array(val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
+                    lower=None, upper=None, b=False, upper_trim=False,
+                    as_bytes=False, exact=False):
+    """Return sexagesimal strings of an array of angles in degrees or hours.
+
+    This is the bulk version of `fmt_angle`. It needs NumPy, except for
+    the fallback described under `as_bytes`.
+
+    Parameters
+    ----------
+    val : array_like
+        The angles (in degrees or hours) that are to be converted into
+        sexagesimal strings. The array is flattened.
+    s1, s2, s3, pre, trunc, lower, upper, b, upper_trim, exact
+        Same as for `fmt_angle`. `pre` cannot be negative.
+    as_bytes : bool
+        If True then a NumPy array of fixed width bytes strings, UTF-8
+        encoded, is returned instead of a list of strings. Default is
+        False.
+
+        If this is False and NumPy is not available, then `fmt_angle`
+        is called for each value; `val` must then be a sequence of
+        numbers.
+
+    Returns
+    -------
+    s : list of str or numpy.ndarray
+        The sexagesimal strings.
+
+    Raises
+    ------
+    ValueError
+        If any value is not finite, as for `fmt_angle`, or if it is
+        2**62 or more in magnitude after normalization and `pre` is not
+        larger than 12.
+
+    Notes
+    -----
+    The angles are decomposed with `deci2sexa_array`, and the characters
+    of all the strings are then generated together from the integer
+    parts; the seconds are kept as an integer number of 10**-pre units
+    so that no float formatting is involved. The output is identical
+    to that from `fmt_angle` with the same options.
+
+    For `pre` larger than 12, the seconds cannot be held exactly in a
+    float and `fmt_angle` is called for each value.
+
+    See also
+    --------
+    fmt_angle
+    deci2sexa_array
+
+    Examples
+    --------
+    >>> x = 23+59/60.0+59.99999/3600.0
+    >>> fmt_angle_array([12.348978659, x, -x])
+    ['+12 20 56.323', '+24 00 00.000', '-24 00 00.000']
+    >>> fmt_angle_array([12.348978659, -x], s1='HH ', s2='MM ', s3='SS', pre=5)
+    ['+12HH 20MM 56.32317SS', '-23HH 59MM 59.99999SS']
+    >>> fmt_angle_array([x, 1.9999], pre=0, lower=0, upper=24, upper_trim=True,
+    ...                 as_bytes=True).tolist()
+    [b'+00 00 00', b'+02 00 00']
+
+    """
+    if pre < 0:
+        raise ValueError("pre must not be negative.")
+
+    try:
+        np = _numpy()
+    except ImportError:
+        if as_bytes:
+            raise
+        return [fmt_angle(i, s1=s1, s2=s2, s3=s3, pre=pre, trunc=trunc,
+                          lower=lower, upper=upper, b=b, upper_trim=upper_trim,
+                          exact=exact)
+                for i in val]
+
+    val = np.asarray(val, dtype=np.float64).ravel()
+    if pre > 12:
+        r = [fmt_angle(i, s1=s1, s2=s2, s3=s3, pre=pre, trunc=trunc,
+                       lower=lower, upper=upper, b=b, upper_trim=upper_trim,
+                       exact=exact)
+             for i in val.tolist()]
+        return np.array([i.encode("utf-8") for i in r]) if as_bytes else r
+
+    sign, hd, mm, ss = _deci2sexa_parts(val, pre, trunc, lower, upper, b,
+                                        upper_trim, exact)
+    ss = ss.astype(np.int64)
+    n = len(val)
+
+    # Number of digits in the first part; at least 2.
+    nd = np.full(n, 2, dtype=np.int64)
+    k = 2
+    while n and 10 ** k <= hd.max():
+        nd += hd >= 10 ** k
+        k += 1
+    wd = int(nd.max()) if n else 2
+
+    # Everything after the first part has the same width for all values.
+    s1, s2, s3 = [i.encode("utf-8") for i in (s1, s2, s3)]
+    tail_width = len(s1) + 2 + len(s2) + (pre + 3 if pre > 0 else 2) + len(s3)
+    tail = np.empty((n, tail_width), dtype=np.uint8)
+    col = 0
+    for i in (s1, mm, s2, ss, s3):
+        if isinstance(i, bytes):
+            tail[:, col:col + len(i)] = np.frombuffer(i, dtype=np.uint8)
+            col += len(i)
+        elif i is mm:
+            _digits(tail, col, mm, 2)
+            col += 2
+        elif pre > 0:
+            _digits(tail, col, ss // 10 ** pre, 2)
+            tail[:, col + 2] = ord(".")
+            _digits(tail, col + 3, ss % 10 ** pre, pre)
+            col += pre + 3
+        else:
+            _digits(tail, col, ss, 2)
+            col += 2
+
+    buf = np.zeros((n, 1 + wd + tail_width), dtype=np.uint8)
+    buf[:, 0] = np.where(sign < 0, ord("-"), ord("+"))
+    # Digits of the first part, right aligned in a field of width wd,
+    # and then shifted left by the unused width.
+    head = np.zeros((n, wd), dtype=np.uint8)
+    _digits(head, 0, hd, wd)
+    rows = np.arange(n)[:, None]
+    shift = (wd - nd)[:, None]
+    cols = np.arange(wd)[None, :]
+    # The unused leading columns of head are sent to the last column,
+    # which is then just padding.
+    buf[rows, np.where(cols >= shift, 1 + cols - shift, buf.shape[1] - 1)] = \
+        np.where(cols >= shift, head, 0)
+    buf[rows, 1 + nd[:, None] + np.arange(tail_width)[None, :]] = tail
+
+    s = buf.view("S{0}".format(buf.shape[1])).ravel()
+    if as_bytes:
+        return s
+    return [i.decode("utf-8") for i in s.tolist()]
+
+
+class FormatCache(object):
+    """Bounded LRU cache of sexagesimal strings from `fmt_angle`.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of strings kept. When the cache is full, the
+        least recently used string is dropped. Default is 1024.
+
+    Attributes
+    ----------
+    maxsize : int
+        Maximum number of strings kept.
+    hits, misses : int
+        Number of calls that found, and did not find, their string in
+        the cache.
+
+    Methods
+    -------
+    fmt_angle : same as the function `fmt_angle`, using the cache.
+    info : return the statistics of the cache.
+    clear : empty the cache and reset the statistics.
+
+    Notes
+    -----
+    The cache is keyed on the value and on all the formatting
+    parameters of `fmt_angle`. It needs `collections.OrderedDict`,
+    i.e., Python 2.7 or later.
+
+    Use `enable_format_cache` to have `Angle`, `AlphaAngle`, `DeltaAngle`,
+    and hence `AngularPosition`, use a cache for their string
+    representations.
+
+    Examples
+    --------
+    >>> c = FormatCache(maxsize=2)
+    >>> c.fmt_angle(12.5), c.fmt_angle(12.5, pre=1), c.fmt_angle(12.5)
+    ('+12 30 00.000', '+12 30 00.0', '+12 30 00.000')
+    >>> c.fmt_angle(-1.25)
+    '-01 15 00.000'
+    >>> c.info() == dict(hits=1, misses=3, maxsize=2, currsize=2)
+    True
+
+    """
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Imported here, and not at the top, since OrderedDict is not
+        # available before Python 2.7.
+        from collections import OrderedDict
+        self._d = OrderedDict()
+
+    def fmt_angle(self, val, s1=" ", s2=" ", s3="", pre=3, trunc=False,
+                  lower=None, upper=None, b=False, upper_trim=False,
+                  exact=False):
+        """Same as the function `fmt_angle`, but using the cache."""
+        key = (val, s1, s2, s3, pre, trunc, lower, upper, b, upper_trim,
+               exact)
+        d = self._d
+        try:
+            s = d.pop(key)
+        except KeyError:
+            self.misses += 1
+            s = fmt_angle(val, s1=s1, s2=s2, s3=s3, pre=pre, trunc=trunc,
+                          lower=lower, upper=upper, b=b, upper_trim=upper_trim,
+                          exact=exact)
+            if len(d) >= self.maxsize:
+                d.popitem(last=False)
+        else:
+            self.hits += 1
+        # Most recently used at the end.
+        d[key] = s
+        return s
+
+    def info(self):
+        """Dictionary with hits, misses, maxsize and currsize."""
+        return dict(hits=self.hits, misses=self.misses, maxsize=self.maxsize,
+                    currsize=len(self._d))
+
+    def clear(self):
+        """Remove all strings, and reset hits and misses."""
+        self._d.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_format_cache = None
+
+
+def enable_format_cache(maxsize=1024):
+    """Use a FormatCache for string representations of angle objects.
+
+    Parameters
+    ----------
+    maxsize : int
+        Size of the cache. Default is 1024.
+
+    Returns
+    -------
+    cache : FormatCache
+        The cache used. This replaces any cache used earlier.
+
+    Notes
+    -----
+    The cache is shared by all `Angle`, `AlphaAngle` and `DeltaAngle`
+    objects, including those in `AngularPosition` objects, and the
+    `HMS` and `DMS` objects of angles. It helps when strings of the same
+    values are needed repeatedly from different objects; repeated calls
+    for the same object are already cheap. The function `fmt_angle` is
+    not affected.
+
+    See also
+    --------
+    disable_format_cache
+
+    """
+    global _format_cache
+    _format_cache = FormatCache(maxsize)
+    return _format_cache
+
+
+def disable_format_cache():
+    """Stop using a FormatCache for string representations of angles."""
+    global _format_cache
+    _format_cache = None
+
+
+def _fmt_angle_cached(val, **kwargs):
+    # fmt_angle, through the FormatCache if one is enabled.
+    if _format_cache is None:
+        return fmt_angle(val, **kwargs)
+    return _format_cache.fmt_angle(val, **kwargs)
+
+
 def phmsdms(hmsdms):
     """Parse a string containing a sexagesimal number.
 
@@ -649,84 +1352,96 @@ def phmsdms(hmsdms):
     But `phmsdms("12:13mm:12.4s")` will not work.
 
     """
-    units = None
-    sign = None
-    # Floating point regex:
-    # http://www.regular-expressions.info/floatingpoint.html
-    #
-    # pattern1: find a decimal number (int or float) and any
-    # characters following it upto the next decimal number.  [^0-9\-+]*
-    # => keep gathering elements until we get to a digit, a - or a
-    # +. These three indicates the possible start of the next number.
-    pattern1 = re.compile(r"([-+]?[0-9]*\.?[0-9]+[^0-9\-+]*)")
+    sign, units, vals, parts = _phmsdms(hmsdms)
+    return dict(sign=sign, units=units, vals=vals, parts=parts)
 
-    # pattern2: find decimal number (int or float) in string.
-    pattern2 = re.compile(r"([-+]?[0-9]*\.?[0-9]+)")
 
-    hmsdms = hmsdms.lower()
-    hdlist = pattern1.findall(hmsdms)
+# Floating point regex:
+# http://www.regular-expressions.info/floatingpoint.html
+#
+# _SEXA_TOKEN: find a decimal number (int or float) and any characters
+# following it upto the next decimal number.  [^0-9\-+]* => keep
+# gathering elements until we get to a digit, a - or a +. These three
+# indicates the possible start of the next number.
+_SEXA_TOKEN = re.compile(r"([-+]?[0-9]*\.?[0-9]+[^0-9\-+]*)")
+
+# _NUMBER: find decimal number (int or float) in string.
+_NUMBER = re.compile(r"([-+]?[0-9]*\.?[0-9]+)")
+
+# Sexagesimal part indicated by a character in the suffix of a number.
+_SUFFIX_PARTS = {"h": 0, "d": 0, "m": 1, "'": 1, "s": 2, '"': 2}
+
+
+def _fill_right_not_none(parts, v):
+    # Find the pos. where parts is not None. Next value must
+    # be inserted to the right of this. If this is 2 then we have
+    # already filled seconds part, raise exception. If this is 1
+    # then fill 2. If this is 0 fill 1. If none of these then fill
+    # 0.
+    rp = reversed(parts)
+    for i, j in enumerate(rp):
+        if j is not None:
+            break
+    if i == 0:
+        # Seconds part already filled.
+        raise ValueError("Invalid string.")
+    elif i == 1:
+        parts[2] = v
+    elif i == 2:
+        # Either parts[0] is None so fill it, or it is filled
+        # and hence fill parts[1].
+        if parts[0] is None:
+            parts[0] = v
+        else:
+            parts[1] = v
 
-    parts = [None, None, None]
 
-    def _fill_right_not_none():
-        # Find the pos. where parts is not None. Next value must
-        # be inserted to the right of this. If this is 2 then we have
-        # already filled seconds part, raise exception. If this is 1
-        # then fill 2. If this is 0 fill 1. If none of these then fill
-        # 0.
-        rp = reversed(parts)
-        for i, j in enumerate(rp):
-            if j is not None:
-                break
-        if i == 0:
-            # Seconds part already filled.
-            raise ValueError("Invalid string.")
-        elif i == 1:
-            parts[2] = v
-        elif i == 2:
-            # Either parts[0] is None so fill it, or it is filled
-            # and hence fill parts[1].
-            if parts[0] is None:
-                parts[0] = v
-            else:
-                parts[1] = v
+def _phmsdms(hmsdms):
+    # Does the work for phmsdms() and parse_many(). Returns the tuple
+    # (sign, units, vals, parts).
+    units = None
+    sign = None
+    parts = [None, None, None]
 
-    for valun in hdlist:
+    for valun in _SEXA_TOKEN.findall(hmsdms):
         try:
             # See if this is pure number.
             v = float(valun)
-            # Sexagesimal part cannot be determined. So guess it by
-            # seeing which all parts have already been identified.
-            _fill_right_not_none()
         except ValueError:
+            v = None
+        if v is not None:
+            # Sexagesimal part cannot be determined. So guess it by
+            # seeing which all parts have already been identified. If
+            # all parts are filled the number is ignored.
+            try:
+                _fill_right_not_none(parts, v)
+            except ValueError:
+                pass
+        else:
             # Not a pure number. Infer sexagesimal part from the
-            # suffix.
-            if "hh" in valun or "h" in valun:
-                m = pattern2.search(valun)
-                parts[0] = float(valun[m.start():m.end()])
-                units = "hours"
-            if "dd" in valun or "d" in valun:
-                m = pattern2.search(valun)
-                parts[0] = float(valun[m.start():m.end()])
+            # characters in the suffix, looking at each only once.
+            m = _NUMBER.match(valun)
+            suffix = valun[m.end():]
+            v = float(m.group())
+            hours = degrees = colon = False
+            for c in suffix.lower():
+                i = _SUFFIX_PARTS.get(c)
+                if i is not None:
+                    parts[i] = v
+                    if c == "h":
+                        hours = True
+                    elif c == "d":
+                        degrees = True
+                elif c == ":":
+                    colon = True
+            if degrees:
                 units = "degrees"
-            if "mm" in valun or "m" in valun:
-                m = pattern2.search(valun)
-                parts[1] = float(valun[m.start():m.end()])
-            if "ss" in valun or "s" in valun:
-                m = pattern2.search(valun)
-                parts[2] = float(valun[m.start():m.end()])
-            if "'" in valun:
-                m = pattern2.search(valun)
-                parts[1] = float(valun[m.start():m.end()])
-            if '"' in valun:
-                m = pattern2.search(valun)
-                parts[2] = float(valun[m.start():m.end()])
-            if ":" in valun:
+            elif hours:
+                units = "hours"
+            if colon:
                 # Sexagesimal part cannot be determined. So guess it by
                 # seeing which all parts have already been identified.
-                v = valun.replace(":", "")
-                v = float(v)
-                _fill_right_not_none()
+                _fill_right_not_none(parts, float(valun.replace(":", "")))
         if not units:
             units = "degrees"
 
@@ -743,7 +1458,88 @@ def phmsdms(hmsdms):
 
     vals = [abs(i) if i is not None else 0.0 for i in parts]
 
-    return dict(sign=sign, units=units, vals=vals, parts=parts)
+    return sign, units, vals, parts
+
+
+def parse_many(hmsdms, lazy=False):
+    """Parse many strings containing sexagesimal numbers.
+
+    Each string is parsed in the same way as in `phmsdms`.
+
+    Parameters
+    ----------
+    hmsdms : iterable of str
+        Strings containing sexagesimal numbers. This can be any
+        iterable, including a generator or a file object.
+    lazy : bool
+        If True then a generator is returned that parses the strings
+        one at a time, as they are read from `hmsdms`. Default is
+        False.
+
+    Returns
+    -------
+    d : dict or generator
+        If `lazy` is False, a dictionary of NumPy arrays, with one row
+        per string:
+
+        sign : int array
+            Signs of the numbers; 1 for positive and -1 for negative.
+        vals : float array of shape (n, 3)
+            The numerical values of the three parts of the numbers.
+        units : str array
+            "degrees" or "hours"; see `phmsdms`.
+
+        If `lazy` is True then a generator that yields a tuple ``(sign,
+        vals, units)`` for each string, where `vals` is a list of 3
+        floats. This does not need NumPy.
+
+    Raises
+    ------
+    ValueError
+        If any string cannot be parsed. See `phmsdms`.
+
+    See also
+    --------
+    phmsdms
+
+    Examples
+    --------
+    >>> r = parse_many(["12h13m12.4s", "-12:13:12.4", "14.56ss"])
+    >>> r['sign'].tolist()
+    [1, -1, 1]
+    >>> r['vals'].tolist()
+    [[12.0, 13.0, 12.4], [12.0, 13.0, 12.4], [0.0, 0.0, 14.56]]
+    >>> r['units'].tolist()
+    ['hours', 'degrees', 'degrees']
+
+    >>> for i in parse_many(["12h", "12d14.56ss"], lazy=True):
+    ...     print(i)
+    (1, [12.0, 0.0, 0.0], 'hours')
+    (1, [12.0, 0.0, 14.56], 'degrees')
+
+    """
+    if lazy:
+        return _parse_many(hmsdms)
+
+    np = _numpy()
+
+    sign = []
+    vals = []
+    units = []
+    for s, v, u in _parse_many(hmsdms):
+        sign.append(s)
+        vals.append(v)
+        units.append(u)
+
+    return dict(sign=np.array(sign, dtype=np.int8),
+                vals=np.array(vals, dtype=np.float64).reshape(-1, 3),
+                units=np.array(units, dtype="U7"))
+
+
+def _parse_many(hmsdms):
+    for i in hmsdms:
+        sign, units, vals, _ = _phmsdms(i)
+        yield sign, vals, units
 
 
 def pposition(hd, details=False):
@@ -814,7 +1610,7 @@ def pposition(hd, details=False):
     """
     # :TODO: split two angles based on user entered separator and process each part separately.
     # Split at any character other than a digit, ".", "-", and "+".
-    p = re.split(r"[^\d\-+.]*", hd)
+    p = _POSITION_SPLIT.split(hd)
     if len(p) not in [2, 6]:
         raise ValueError("Input must contain either 2 or 6 numbers.")
 
@@ -827,13 +1623,13 @@ def pposition(hd, details=False):
             raw_y = p[1]
     # Two sexagesimal numbers if string has 6 numbers.
     elif len(p) == 6:
-        x_p = phmsdms(" ".join(p[:3]))
-        x = sexa2deci(x_p['sign'], *x_p['vals'])
-        y_p = phmsdms(" ".join(p[3:]))
-        y = sexa2deci(y_p['sign'], *y_p['vals'])
+        x_p = _psexa(p[:3])
+        x = sexa2deci(x_p[0], *x_p[2])
+        y_p = _psexa(p[3:])
+        y = sexa2deci(y_p[0], *y_p[2])
         if details:
-            raw_x = x_p
-            raw_y = y_p
+            raw_x = dict(zip(("sign", "units", "vals", "parts"), x_p))
+            raw_y = dict(zip(("sign", "units", "vals", "parts"), y_p))
             numvals = 6
 
     if details:
@@ -845,10 +1641,143 @@ def pposition(hd, details=False):
     return result
 
 
-def sep(a1, b1, a2, b2):
-    """Angular spearation between two points on a unit sphere.
+# Separators between the numbers in a string parsed by pposition().
+_POSITION_SPLIT = re.compile(r"[^\d\-+.]+")
+
+# A string that phmsdms() sees as exactly one pure number.
+_PURE_NUMBER = re.compile(r"[-+]?[0-9]+(\.[0-9]+)?$")
+
+
+def _psexa(p):
+    # Same as _phmsdms(" ".join(p)) for the three strings in p; but if
+    # each of them is a single number, then the sexagesimal parts are
+    # just these numbers in that order and the string need not be
+    # joined and parsed again.
+    for i in p:
+        if not _PURE_NUMBER.match(i):
+            return _phmsdms(" ".join(p))
+
+    parts = [float(i) for i in p]
+    # Only the first identified part can have a -ve sign.
+    neg = [i for i in parts if i and i < 0.0]
+    if len(neg) > 1:
+        raise ValueError("Only one number can be negative.")
+    sign = -1 if neg else 1
+    return sign, "degrees", [abs(i) for i in parts], parts
+
+
+def _hd2deg(hd):
+    # Parse a position string into (alpha, delta) in degrees, using the
+    # rules in AngularPosition.from_hd().
+    r = pposition(hd, details=True)
+    if r['numvals'] == 6:
+        raw_x = r['raw_x']
+        if raw_x['units'] == "degrees" and ("d" in hd or "dd" in hd):
+            # phmsdms called by pposition returns degrees if "hh"
+            # or "h" is not in hd. We want the reverse here.
+            # Assume degrees only if "d" or "dd" is present in hd.
+            x = r['x']
+        else:
+            # Assume that this is hours.
+            x = h2d(r['x'])
 
-    This will be an angle between [0, π] radians.
+        raw_y = r['raw_y']
+        if raw_y['units'] == "hours":
+            y = h2d(r['y'])
+        else:
+            y = r['y']  # Assume degrees.
+
+    else:
+        x = h2d(r['x'])
+        y = r['y']
+
+    return x, y
+
+
+def pposition_chunks(lines, chunksize=65536, skip_invalid=False):
+    """Parse lines containing angular positions, in chunks.
+
+    Each line is parsed as in `AngularPosition.from_hd`, and the
+    positions are returned in chunks of NumPy arrays. This needs NumPy.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines containing 2 or 6 numbers each; see `pposition`. This can
+        be a file object opened in text mode, or any iterator of
+        strings. Leading and trailing white space is ignored, and so
+        are blank lines.
+    chunksize : int
+        Maximum number of positions in each chunk. Default is 65536.
+    skip_invalid : bool
+        If True then lines that cannot be parsed are skipped. Default
+        is False, in which case a ValueError is raised.
+
+    Returns
+    -------
+    g : generator
+        Generator that yields tuples ``(alpha, delta)`` of arrays of
+        floats. `alpha` is the longitude like angle and `delta` is the
+        latitude like angle, both in degrees.
+
+    Notes
+    -----
+    If a line has 2 numbers, then the first is taken to be in hours
+    and the second in degrees. If a line has 6 numbers, then the first
+    three are taken to be in hours unless the line contains "d", and
+    the last three are in degrees.
+
+    The lines are read only as they are needed, and at most
+    `chunksize` positions are held in memory, so that files of any
+    size can be processed.
+
+    See also
+    --------
+    pposition
+    AngularPosition.from_hd
+
+    Examples
+    --------
+    >>> lines = ["12 22 54.899 +15 49 20.57", "12d 22 54.899 +15 49 20.57",
+    ...          "", "12.5 -45.0"]
+    >>> for alpha, delta in pposition_chunks(lines, chunksize=2):
+    ...     print(alpha.round(6).tolist(), delta.round(6).tolist())
+    [185.728746, 12.381916] [15.822381, 15.822381]
+    [187.5] [-45.0]
+
+    """
+    np = _numpy()
+
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive.")
+
+    alpha = []
+    delta = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            x, y = _hd2deg(line)
+        except ValueError:
+            if skip_invalid:
+                continue
+            raise
+        alpha.append(x)
+        delta.append(y)
+        if len(alpha) == chunksize:
+            yield np.array(alpha), np.array(delta)
+            alpha = []
+            delta = []
+
+    if alpha:
+        yield np.array(alpha), np.array(delta)
+
+
+def sep(a1, b1, a2, b2):
+    """Angular spearation between two points on a unit sphere.
+
+    This will be an angle between [0, π] radians.
 
     Parameters
     ----------
@@ -892,20 +1821,133 @@ def sep(a1, b1, a2, b2):
     >>> 90.0 * math.cos(d2r(45.0))  # Distance along latitude circle.
     63.63961030678928
     """
-    # Tolerance to decide if the calculated separation is zero.
-    tol = 1e-15
+    return sep_vec(unit_vector(a1, b1), unit_vector(a2, b2))
+
+
+def unit_vector(alpha, delta):
+    """Unit vector, as an (x, y, z) tuple, of a point on a sphere.
+
+    The components are the same as those of
+    ``CartesianVector.from_spherical(1.0, alpha, delta)``. The tuple can
+    be passed to `sep_vec` and `bear_vec`.
+
+    Parameters
+    ----------
+    alpha, delta : float
+        Longitude-like and latitude-like angles, in radians.
+
+    Examples
+    --------
+    >>> [round(i, 12) for i in unit_vector(d2r(90.0), d2r(45.0))]
+    [0.0, 0.707106781187, 0.707106781187]
+
+    """
+    cd = math.cos(delta)
+    return (cd * math.cos(alpha), cd * math.sin(alpha), math.sin(delta))
+
+
+def sep_vec(v1, v2):
+    """Angular separation between two points given as unit vectors.
+
+    This is `sep` for points given as (x, y, z) tuples, for example from
+    `unit_vector`. No intermediate objects are created, and the steps
+    are the same as in `sep`, so that the results are identical.
+
+    Parameters
+    ----------
+    v1, v2 : tuple of 3 floats
+        Unit vectors of the two points.
+
+    Returns
+    -------
+    s : float
+        Separation in radians, in the range [0, π].
 
-    v = CartesianVector.from_spherical(1.0, a1, b1)
-    v2 = CartesianVector.from_spherical(1.0, a2, b2)
-    d = v.dot(v2)
-    c = v.cross(v2).mod
+    See also
+    --------
+    sep
+    unit_vector
 
-    res = math.atan2(c, d)
+    Examples
+    --------
+    >>> r2d(sep_vec((1.0, 0.0, 0.0), (0.0, 0.0, 1.0)))
+    90.0
 
-    if abs(res) < tol:
+    """
+    x1, y1, z1 = v1
+    x2, y2, z2 = v2
+    # |v1 x v2| and v1 . v2, as in CartesianVector.cross and dot.
+    cx = y1 * z2 - z1 * y2
+    cy = -(x1 * z2 - z1 * x2)
+    cz = x1 * y2 - y1 * x2
+    res = math.atan2(math.sqrt(cx ** 2 + cy ** 2 + cz ** 2),
+                     x1 * x2 + y1 * y2 + z1 * z2)
+    # Tolerance to decide if the calculated separation is zero.
+    if abs(res) < 1e-15:
         return 0.0
-    else:
-        return res
+    return res
+
+
+def _unit_vectors(alpha, delta):
+    # Arrays of x, y and z components of unit vectors; same as
+    # CartesianVector.from_spherical(1.0, alpha, delta).
+    np = _numpy()
+    cd = np.cos(delta)
+    return (cd * np.cos(alpha), cd * np.sin(alpha), np.sin(delta))
+
+
+def _sep_xyz(v1, v2):
+    # Separation between arrays of unit vectors given as (x, y, z)
+    # tuples; same steps as in sep().
+    np = _numpy()
+    d = v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]
+    cx, cy, cz = _cross_xyz(v1, v2)
+    res = np.arctan2(np.sqrt(cx ** 2 + cy ** 2 + cz ** 2), d)
+    return np.where(np.abs(res) < 1e-15, 0.0, res)
+
+
+def sep_array(a1, b1, a2, b2):
+    """Angular separation between arrays of points on a unit sphere.
+
+    This is the vectorized version of `sep`. It needs NumPy.
+
+    Parameters
+    ----------
+    a1, b1 : array_like
+        Longitude-like and latitude-like angles defining the first
+        points. Both are in radians.
+
+    a2, b2 : array_like
+        Longitude-like and latitude-like angles defining the second
+        points. Both are in radians.
+
+    Returns
+    -------
+    s : numpy.ndarray
+        Separations in radians, in the range [0, π].
+
+    Notes
+    -----
+    The two sets of points are broadcast against each other. So the
+    separations can be found from one point to many, from many points
+    to one, or element by element between two arrays of the same
+    shape.
+
+    The same vector formula and the same tolerance for zero separation
+    as in `sep` are used.
+
+    See also
+    --------
+    sep
+
+    Examples
+    --------
+    >>> s = sep_array(0, 0, [0, 0, d2r(90.0)], [0, d2r(90.0), 0])
+    >>> [r2d(i) for i in s]
+    [0.0, 90.0, 90.0]
+
+    """
+    return _sep_xyz(_unit_vectors(a1, b1), _unit_vectors(a2, b2))
 
 
 def bear(a1, b1, a2, b2):
@@ -964,47 +2006,162 @@ def bear(a1, b1, a2, b2):
     # sign of the z component of the latter vector to determine
     # quadrant: 1st and 2nd quadrants are +ve while 3rd and 4th are
     # negative.
-    #
-    # Tolerance to decide if first is on the pole and also to decide if
-    # the calculated bearing is zero.
-    tol = 1e-15
+    return bear_vec(unit_vector(a1, b1), unit_vector(a2, b2))
+
+
+def _meridian_normal(v1):
+    # v1 x z-axis: the vector perpendicular to the great circle
+    # containing v1 and the z-axis.
+    x1, y1, z1 = v1
+    x0, y0, z0 = _Z_AXIS
+    return (y1 * z0 - z1 * y0, -(x1 * z0 - z1 * x0), x1 * y0 - y1 * x0)
+
+
+def _bear_vec(v1, v10, v2):
+    # bear_vec with the meridian normal v10 of v1 given. The first point
+    # must not be on a pole.
+    x1, y1, z1 = v1
+    x2, y2, z2 = v2
+    # Vector perpendicular to great circle containing two points.
+    ax = y1 * z2 - z1 * y2
+    ay = -(x1 * z2 - z1 * x2)
+    az = x1 * y2 - y1 * x2
+    # Find angle between this and the meridian normal.
+    bx, by, bz = v10
+    cx = ay * bz - az * by
+    cy = -(ax * bz - az * bx)
+    cz = ax * by - ay * bx
+    x = math.atan2(math.sqrt(cx ** 2 + cy ** 2 + cz ** 2),
+                   ax * bx + ay * by + az * bz)
+    # If z is negative then we are in the 3rd or 4th quadrant.
+    if az < 0:
+        x = -x
+    # Tolerance to decide if the calculated bearing is zero.
+    if abs(x) < 1e-15:
+        return 0.0
+    return x
+
+
+def bear_vec(v1, v2):
+    """Bearing, or position angle, between two points given as unit vectors.
+
+    This is `bear` for points given as (x, y, z) tuples, for example from
+    `unit_vector`. No intermediate objects are created, and the steps
+    are the same as in `bear`, so that the results are identical.
+
+    Parameters
+    ----------
+    v1, v2 : tuple of 3 floats
+        Unit vectors of the first and the second point.
 
-    v1 = CartesianVector.from_spherical(1.0, a1, b1)
-    v2 = CartesianVector.from_spherical(1.0, a2, b2)
+    Returns
+    -------
+    x : float
+        Position angle, in radians, of the second point with respect to
+        the first. If the first point is on a pole, then a warning is
+        issued and 0.0 is returned.
+
+    See also
+    --------
+    bear
+    unit_vector
 
-    # Z-axis
-    v0 = CartesianVector.from_spherical(r=1.0, alpha=0.0, delta=d2r(90.0))
+    Examples
+    --------
+    >>> r2d(bear_vec(unit_vector(d2r(45.0), d2r(45.0)), unit_vector(d2r(46.0), d2r(45.0))))
+    89.64644212193384
 
-    if abs(v1.cross(v0).mod) < tol:
+    """
+    v10 = _meridian_normal(v1)
+    # Tolerance to decide if first is on the pole.
+    if math.sqrt(v10[0] ** 2 + v10[1] ** 2 + v10[2] ** 2) < 1e-15:
         # The first point is on the pole. Bearing is undefined.
         warnings.warn(
             "First point is on the pole. Bearing undefined.")
         return 0.0
+    return _bear_vec(v1, v10, v2)
 
-    # Vector perpendicular to great circle containing two points.
-    v12 = v1.cross(v2)
 
-    # Vector perpendicular to great circle containing base and
-    # Z-axis.
-    v10 = v1.cross(v0)
+def _cross_xyz(v1, v2):
+    # Cross product of arrays of vectors given as (x, y, z) tuples; same
+    # as CartesianVector.cross.
+    x1, y1, z1 = v1
+    x2, y2, z2 = v2
+    return (y1 * z2 - z1 * y2, -(x1 * z2 - z1 * x2), x1 * y2 - y1 * x2)
 
-    # Find angle between these two vectors.
-    dot = v12.dot(v10)
-    cross = v12.cross(v10).mod
-    x = math.atan2(cross, dot)
 
-    # If z is negative then we are in the 3rd or 4th quadrant.
-    if v12.z < 0:
-        x = -x
+def _bear_xyz(v1, v2):
+    # Bearing between arrays of unit vectors given as (x, y, z) tuples,
+    # and a mask that is True where the first point is on a pole; same
+    # steps as in bear().
+    np = _numpy()
+    tol = 1e-15
 
-    if abs(x) < tol:
-        return 0.0
-    else:
-        return x
+    v10 = _cross_xyz(v1, _Z_AXIS)
+    undefined = np.sqrt(v10[0] ** 2 + v10[1] ** 2 + v10[2] ** 2) < tol
+
+    v12 = _cross_xyz(v1, v2)
+    dot = v12[0] * v10[0] + v12[1] * v10[1] + v12[2] * v10[2]
+    c = _cross_xyz(v12, v10)
+    x = np.arctan2(np.sqrt(c[0] ** 2 + c[1] ** 2 + c[2] ** 2), dot)
+    x = np.where(v12[2] < 0, -x, x)
+    x = np.where((np.abs(x) < tol) | undefined, 0.0, x)
+    return x, np.broadcast_to(undefined, x.shape).copy()
+
+
+def bear_array(a1, b1, a2, b2):
+    """Find bearing/position angle between arrays of points on a sphere.
+
+    This is the vectorized version of `bear`. It needs NumPy.
+
+    Parameters
+    ----------
+    a1, b1 : array_like
+        Longitude-like and latitude-like angles defining the first
+        points. Both are in radians.
+
+    a2, b2 : array_like
+        Longitude-like and latitude-like angles defining the second
+        points. Both are in radians.
+
+    Returns
+    -------
+    x : numpy.ndarray
+        Position angles, in radians, of the second points with respect
+        to the first points.
+    undefined : numpy.ndarray
+        Boolean array that is True where the first point is on a pole,
+        and hence the bearing is undefined. The bearing is 0 there.
+
+    Notes
+    -----
+    The two sets of points are broadcast against each other, as in
+    `sep_array`. Results are the same as those from `bear`, except that
+    no warning is issued for points on the poles; use the returned
+    mask instead.
+
+    See also
+    --------
+    bear
+
+    Examples
+    --------
+    >>> x, undefined = bear_array(d2r(45.0), d2r(45.0),
+    ...                           [d2r(46.0), d2r(44.0)], d2r(45.0))
+    >>> [round(r2d(i), 8) for i in x]
+    [89.64644212, -89.64644212]
+    >>> x, undefined = bear_array(0, [d2r(90.0), 0], 0, [0, d2r(90.0)])
+    >>> x.tolist(), undefined.tolist()
+    ([0.0, 0.0], [True, False])
+
+    """
+    return _bear_xyz(_unit_vectors(a1, b1), _unit_vectors(a2, b2))
 
 
 class HMS(object):
     """Class for representing angle as HMS, designed to be used with Angle."""
+    __slots__ = ('angle', 's1', 's2', 's3')
+
     def __init__(self, angle):
         self.angle = angle
         self.s1 = 'HH '
@@ -1012,12 +2169,16 @@ class HMS(object):
         self.s3 = 'SS'
 
     def __gethms(self):
+        a = self.angle
+        return a._memo("hms", (a._getnorm(), a.pre, a.trunc), self.__hms)
+
+    def __hms(self):
         a = self.angle
         lower = r2h(a._lower) if a._lower is not None else None
         upper = r2h(a._upper) if a._upper is not None else None
         return deci2sexa(
             a.h, pre=a.pre, trunc=a.trunc, lower=lower, upper=upper,
-            upper_trim=a._upper_trim, b=a._b)
+            upper_trim=a._upper_trim, b=a._b, exact=a._exact)
 
     def __sethms(self, val):
         if len(val) != 4:
@@ -1073,12 +2234,18 @@ class HMS(object):
     ss = property(__getss, __setss, doc="SS of HMS angle.")
 
     def __str__(self):
+        a = self.angle
+        key = (a._getnorm(), a.pre, a.trunc, self.s1, self.s2, self.s3)
+        return a._memo("hms_str", key, self.__str)
+
+    def __str(self):
         a = self.angle
         lower = r2h(a._lower) if a._lower is not None else None
         upper = r2h(a._upper) if a._upper is not None else None
-        return fmt_angle(
+        return _fmt_angle_cached(
             a.h, s1=self.s1, s2=self.s2, s3=self.s3, pre=a.pre, trunc=a.trunc,
-            lower=lower, upper=upper, upper_trim=a._upper_trim, b=a._b)
+            lower=lower, upper=upper, upper_trim=a._upper_trim, b=a._b,
+            exact=a._exact)
 
 
 class HMSDescriptor(object):
@@ -1092,6 +2259,8 @@ class HMSDescriptor(object):
 
 class DMS(object):
     """Class for representing angle as DMS, designed to be used with Angle."""
+    __slots__ = ('angle', 's1', 's2', 's3')
+
     def __init__(self, angle):
         self.angle = angle
         self.s1 = 'DD '
@@ -1099,12 +2268,16 @@ class DMS(object):
         self.s3 = 'SS'
 
     def __getdms(self):
+        a = self.angle
+        return a._memo("dms", (a._getnorm(), a.pre, a.trunc), self.__dms)
+
+    def __dms(self):
         a = self.angle
         lower = r2d(a._lower) if a._lower is not None else None
         upper = r2d(a._upper) if a._upper is not None else None
         return deci2sexa(
             a.d, pre=a.pre, trunc=a.trunc, lower=lower, upper=upper,
-            upper_trim=a._upper_trim, b=a._b)
+            upper_trim=a._upper_trim, b=a._b, exact=a._exact)
 
     def __setdms(self, val):
         if len(val) != 4:
@@ -1159,12 +2332,18 @@ class DMS(object):
     ss = property(__getss, __setss, doc="SS of DMS angle.")
 
     def __str__(self):
+        a = self.angle
+        key = (a._getnorm(), a.pre, a.trunc, self.s1, self.s2, self.s3)
+        return a._memo("dms_str", key, self.__str)
+
+    def __str(self):
         a = self.angle
         lower = r2d(a._lower) if a._lower is not None else None
         upper = r2d(a._upper) if a._upper is not None else None
-        return fmt_angle(
+        return _fmt_angle_cached(
             a.d, s1=self.s1, s2=self.s2, s3=self.s3, pre=a.pre, trunc=a.trunc,
-            lower=lower, upper=upper, upper_trim=a._upper_trim, b=a._b)
+            lower=lower, upper=upper, upper_trim=a._upper_trim, b=a._b,
+            exact=a._exact)
 
 
 class DMSDescriptor(object):
@@ -1394,22 +2573,32 @@ class Angle(object):
     #
     # The string representation will need to be changed when
     # normalizing method changes. So override __str__.
+    #
+    # Instances store their data in slots, set in __init__, instead of
+    # a __dict__. Subclasses must define __slots__ too, even if empty,
+    # to keep it that way.
+    #
+    # The sexagesimal tuples and strings are remembered in `_cache`,
+    # see `_memo`.
+    __slots__ = ('_raw', '_iunit', '_ounit', 'pre', 'trunc', 's1', 's2', 's3',
+                 '_cache')
     _units = ("radians", "degrees", "hours")
     _keyws = ('r', 'd', 'h', 'arcs', "sg")
-    _raw = 0.0  # angle in radians
-    _iunit = 0
-    _ounit = "radians"
     _upper_trim = False
     _lower = None  # always in radians
     _upper = None  # always in radians
     _b = False
-    pre = 3
-    trunc = False
-    s1 = " "
-    s2 = " "
-    s3 = ""
+    _exact = False  # the exact keyword of deci2sexa, for formatting
 
     def __init__(self, sg=None, **kwargs):
+        self._raw = 0.0  # angle in radians
+        self._iunit = 0
+        self.pre = 3
+        self.trunc = False
+        self.s1 = " "
+        self.s2 = " "
+        self.s3 = ""
+        self._cache = None
         if sg is not None:
             kwargs['sg'] = sg
         x = (True if i in self._keyws else False for i in kwargs)
@@ -1420,30 +2609,28 @@ class Angle(object):
             if x['units'] not in self._units:
                 raise ValueError("Unknow units: {0}".format(x['units']))
             self._iunit = self._units.index(x['units'])
+            # The r, d and h properties are used, so that subclasses
+            # can change how values are stored.
             if self._iunit == 1:
-                self._setnorm(d2r(sexa2deci(x['sign'], *x['vals'])))
+                self.d = sexa2deci(x['sign'], *x['vals'])
             elif self._iunit == 2:
-                self._setnorm(h2r(sexa2deci(x['sign'], *x['vals'])))
+                self.h = sexa2deci(x['sign'], *x['vals'])
             if len(kwargs) != 1:
                 warnings.warn("Only sg = {0} used.".format(kwargs['sg']))
         elif "r" in kwargs:
-            self._iunit = 0
-            self._setnorm(kwargs['r'])
+            self.r = kwargs['r']
             if len(kwargs) != 1:
                 warnings.warn("Only r = {0} used.".format(kwargs['r']))
         elif "d" in kwargs:
-            self._iunit = 1
-            self._setnorm(d2r(kwargs["d"]))
+            self.d = kwargs["d"]
             if len(kwargs) != 1:
                 warnings.warn("Only d = {0} used.".format(kwargs['d']))
         elif "h" in kwargs:
-            self._iunit = 2
-            self._setnorm(h2r(kwargs['h']))
+            self.h = kwargs['h']
             if len(kwargs) != 1:
                 warnings.warn("Only h = {0} used.".format(kwargs['h']))
         elif "arcs" in kwargs:
-            self._iunit = 1
-            self._setnorm(arcs2r(kwargs['arcs']))
+            self.arcs = kwargs['arcs']
             if len(kwargs) != 1:
                 warnings.warn("Only arcs = {0} used.".format(kwargs['arcs']))
 
@@ -1456,6 +2643,25 @@ class Angle(object):
         # Override this method in other classes.
         self._raw = val
 
+    def _memo(self, kind, key, f):
+        # Return f(), remembering the result for the given kind of
+        # value, e.g., "hms", along with the key used to compute it.
+        # The key includes the angle and the formatting attributes, so
+        # changing any of these invalidates the remembered value.
+        if self._cache is None:
+            self._cache = {}
+        x = self._cache.get(kind)
+        if x is not None and x[0] == key:
+            return x[1]
+        v = f()
+        self._cache[kind] = (key, v)
+        return v
+
+    def _fmt_key(self):
+        # Everything that the string representation depends on.
+        return (self._getnorm(), self.ounit, self.pre, self.trunc,
+                self.s1, self.s2, self.s3)
+
     def __getr(self):
         return self._getnorm()
 
@@ -1510,16 +2716,21 @@ class Angle(object):
         return str(self.r)
 
     def __str__(self):
+        return self._memo("str", self._fmt_key(), self.__str)
+
+    def __str(self):
         if self.ounit == "radians":
             return str(self.r)
         elif self.ounit == "degrees":
-            return fmt_angle(self.d, s1=self.s1, s2=self.s2,
-                             s3=self.s3,
-                             pre=self.pre, trunc=self.trunc)
+            return _fmt_angle_cached(self.d, s1=self.s1, s2=self.s2,
+                                     s3=self.s3,
+                                     pre=self.pre, trunc=self.trunc,
+                                     exact=self._exact)
         elif self.ounit == "hours":
-            return fmt_angle(self.h, s1=self.s1, s2=self.s2,
-                             s3=self.s3,
-                             pre=self.pre, trunc=self.trunc)
+            return _fmt_angle_cached(self.h, s1=self.s1, s2=self.s2,
+                                     s3=self.s3,
+                                     pre=self.pre, trunc=self.trunc,
+                                     exact=self._exact)
 
     def __add__(self, other):
         if not isinstance(other, Angle):
@@ -1655,13 +2866,13 @@ class AlphaAngle(Angle):
     1.0
 
     """
+    __slots__ = ()
     _upper_trim = True
     _lower = 0
     _upper = h2r(24)
 
     def __init__(self, sg=None, **kwargs):
         super(AlphaAngle, self).__init__(sg=sg, **kwargs)
-        self.__ounit = "hours"
         self.s1 = "HH "
         self.s2 = "MM "
         self.s3 = "SS"
@@ -1671,17 +2882,20 @@ class AlphaAngle(Angle):
         self._raw = r2r(val)  # [0, 2π) i.e., h = [0, 24).
 
     def __getounit(self):
-        return self.__ounit
+        return "hours"
 
     ounit = property(fget=__getounit,
                      doc="Formatting unit: always hours for RA.")
 
     def __str__(self):
+        return self._memo("str", self._fmt_key(), self.__str)
+
+    def __str(self):
         # Always HMS. Need lower, upper so that upper_trim works.
-        return fmt_angle(self.h, s1=self.s1, s2=self.s2, s3=self.s3,
-                         pre=self.pre, trunc=self.trunc,
-                         lower=r2h(self._lower), upper=r2h(self._upper),
-                         upper_trim=self._upper_trim)
+        return _fmt_angle_cached(self.h, s1=self.s1, s2=self.s2, s3=self.s3,
+                                 pre=self.pre, trunc=self.trunc,
+                                 lower=r2h(self._lower), upper=r2h(self._upper),
+                                 upper_trim=self._upper_trim)
 
     def __add__(self, other):
         """Adds any type of angle to this."""
@@ -1834,6 +3048,7 @@ class DeltaAngle(Angle):
     -01DD 00MM 00.000SS
 
     """
+    __slots__ = ()
     _upper_trim = False
     _lower = -math.pi / 2
     _upper = math.pi / 2
@@ -1841,7 +3056,6 @@ class DeltaAngle(Angle):
 
     def __init__(self, sg=None, **kwargs):
         super(DeltaAngle, self).__init__(sg=sg, **kwargs)
-        self.__ounit = "degrees"
         self.s1 = "DD "
         self.s2 = "MM "
         self.s3 = "SS"
@@ -1851,7 +3065,7 @@ class DeltaAngle(Angle):
         self._raw = normalize(val, lower=self._lower, upper=self._upper, b=self._b)
 
     def __getounit(self):
-        return self.__ounit
+        return "degrees"
 
     ounit = property(fget=__getounit,
                      doc="Formatting unit: always degrees for Dec.")
@@ -1863,10 +3077,14 @@ class DeltaAngle(Angle):
                          lower=r2d(self._lower), upper=r2d(self._upper), b=self._b)
 
     def __str__(self):
+        return self._memo("str", self._fmt_key(), self.__str)
+
+    def __str(self):
         # Always DMS.
-        return fmt_angle(self.d, s1=self.s1, s2=self.s2, s3=self.s3,
-                         pre=self.pre, trunc=self.trunc,
-                         lower=r2d(self._lower), upper=r2d(self._upper), b=self._b)
+        return _fmt_angle_cached(self.d, s1=self.s1, s2=self.s2, s3=self.s3,
+                                 pre=self.pre, trunc=self.trunc,
+                                 lower=r2d(self._lower), upper=r2d(self._upper),
+                                 b=self._b)
 
     def __add__(self, other):
         """Adds any type of angle to this."""
@@ -1881,6 +3099,242 @@ class DeltaAngle(Angle):
         return DeltaAngle(r=self.r - other.r)
 
 
+class FixedAngle(Angle):
+    """An angle stored as an integer number of nano-arcseconds.
+
+    FixedAngle is a subclass of Angle, with the same parameters,
+    attributes and formatting. The angle is held in the attribute `n`,
+    an integer number of nano-arcseconds (1e-9 arc-seconds), instead of
+    a float number of radians. Addition and subtraction of FixedAngle
+    objects are exact, and FixedAngle objects can be compared and used
+    as dictionary keys.
+
+    Parameters
+    ----------
+    n : int
+        Angle in nano-arcseconds.
+    sg, r, d, h, arcs
+        Same as for `Angle`. The value is rounded to the nearest
+        nano-arcsecond.
+
+    Attributes
+    ----------
+    n : int
+        Angle in nano-arcseconds.
+
+    Notes
+    -----
+    The other units are computed from `n`, with a single rounding for
+    `d`, `h` and `arcs` if `n` is less than 2**53, i.e., for angles
+    of up to about 690 degrees. Values in these units are converted into `n`
+    with rounding to nearest, ties to even, as decided by the exact
+    value of the float. Radians are converted through degrees.
+
+    An angle in [-360, 360] degrees survives the conversion to an
+    `Angle`, and back, without change in `n`. The range of `n` is not
+    limited, but it fits in a 64 bit integer for angles of up to about
+    2.5 million degrees.
+
+    The sexagesimal parts and strings are computed with
+    ``exact=True``; see `deci2sexa`.
+
+    Objects are mutable, like Angle objects. An object must not be
+    changed while it is used in a set or as a dictionary key.
+
+    See also
+    --------
+    Angle (for common attributes)
+
+    Examples
+    --------
+    >>> from __future__ import print_function
+    >>> from angles import FixedAngle
+    >>> a = FixedAngle(d=0.1)
+    >>> a.n, a.d, a.arcs
+    (360000000000, 0.1, 360.0)
+    >>> b = FixedAngle(d=0)
+    >>> for i in range(100):
+    ...     b = b + a
+    >>> b.n, b.d, b == FixedAngle(d=10)
+    (36000000000000, 10.0, True)
+
+    The same sum with Angle has rounding errors.
+
+    >>> c = Angle(d=0.1)
+    >>> b = Angle(d=0)
+    >>> for i in range(100):
+    ...     b = b + c
+    >>> b.d
+    10.00000000000001
+
+    >>> a = FixedAngle("12h34m16.592849219")
+    >>> a.hms.hms
+    (1, 12, 34, 16.593)
+    >>> print(a)
+    +12 34 16.593
+    >>> a.wrap(-180, 180).d
+    -171.43086312825417
+    >>> sorted([FixedAngle(d=2), FixedAngle(arcs=1), FixedAngle(h=-1)])[0].d
+    -15.0
+
+    """
+    __slots__ = ('_n',)
+    _exact = True
+    # Nano-arcseconds in an arc-second, a degree and an hour.
+    _ARCS = 10 ** 9
+    _DEG = 3600 * _ARCS
+    _HOUR = 15 * _DEG
+
+    def __init__(self, sg=None, n=None, **kwargs):
+        self._n = 0
+        if n is None:
+            super(FixedAngle, self).__init__(sg=sg, **kwargs)
+        elif sg is not None or kwargs:
+            raise TypeError("Only one of n and {0} is allowed.".format(
+                self._keyws))
+        else:
+            super(FixedAngle, self).__init__()
+            self.n = n
+            self._iunit = 1
+            self._ounit = "degrees"
+
+    def _set(self, val, scale):
+        # Set _n to val * scale, rounded from the exact value of val.
+        n = int(_scale_int(abs(val), scale))
+        self._n = -n if val < 0 else n
+
+    # In the getters _n is converted to float, so that the division is
+    # not an integer division in Python 2. The conversion is exact for
+    # angles of up to about 690 degrees.
+
+    def _getnorm(self):
+        return d2r(float(self._n) / self._DEG)
+
+    def _setnorm(self, val):
+        # overriding the method in Angle.
+        self._set(r2d(val), self._DEG)
+
+    def __getn(self):
+        return self._n
+
+    def __setn(self, val):
+        if val != int(val):
+            raise ValueError("n must be an integer.")
+        self._n = int(val)
+
+    n = property(__getn, __setn, doc="Angle in nano-arcseconds.")
+
+    def __getr(self):
+        return self._getnorm()
+
+    def __setr(self, val):
+        self._iunit = 0
+        self._setnorm(val)
+
+    r = property(__getr, __setr, doc="Angle in radians.")
+
+    def __getd(self):
+        return float(self._n) / self._DEG
+
+    def __setd(self, val):
+        self._iunit = 1
+        self._set(val, self._DEG)
+
+    d = property(__getd, __setd, doc="Angle in degrees.")
+
+    def __geth(self):
+        return float(self._n) / self._HOUR
+
+    def __seth(self, val):
+        self._iunit = 2
+        self._set(val, self._HOUR)
+
+    h = property(__geth, __seth, doc="Angle in hours.")
+
+    def __getarcs(self):
+        return float(self._n) / self._ARCS
+
+    def __setarcs(self, val):
+        self._iunit = 1
+        self._set(val, self._ARCS)
+
+    arcs = property(__getarcs, __setarcs, doc="Angle in arcseconds.")
+
+    @classmethod
+    def from_angle(cls, angle):
+        """FixedAngle with the value and formatting of the given Angle.
+
+        The value is rounded to the nearest nano-arcsecond.
+        """
+        a = cls(r=angle.r)
+        a.ounit, a.pre, a.trunc = angle.ounit, angle.pre, angle.trunc
+        return a
+
+    def to_angle(self):
+        """Angle with the value and formatting of this angle."""
+        a = Angle(r=self.r)
+        a.ounit, a.pre, a.trunc = self.ounit, self.pre, self.trunc
+        return a
+
+    def wrap(self, lower=0, upper=360):
+        """Return the angle normalized into [lower, upper) degrees.
+
+        This is the same as `normalize` with ``b=False``, but done on
+        the integer `n`. The limits are rounded to the nearest
+        nano-arcsecond.
+        """
+        lo = FixedAngle(d=lower)._n
+        hi = FixedAngle(d=upper)._n
+        if hi <= lo:
+            raise ValueError("upper must be larger than lower.")
+        return FixedAngle(n=lo + (self._n - lo) % (hi - lo))
+
+    def __eq__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n == other._n
+
+    def __ne__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n != other._n
+
+    def __lt__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n < other._n
+
+    def __le__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n <= other._n
+
+    def __gt__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n > other._n
+
+    def __ge__(self, other):
+        if not isinstance(other, FixedAngle):
+            return NotImplemented
+        return self._n >= other._n
+
+    def __hash__(self):
+        return hash(self._n)
+
+    def __add__(self, other):
+        """Exact for two FixedAngle objects, else same as for Angle."""
+        if isinstance(other, FixedAngle):
+            return FixedAngle(n=self._n + other._n)
+        return super(FixedAngle, self).__add__(other)
+
+    def __sub__(self, other):
+        """Exact for two FixedAngle objects, else same as for Angle."""
+        if isinstance(other, FixedAngle):
+            return FixedAngle(n=self._n - other._n)
+        return super(FixedAngle, self).__sub__(other)
+
+
 class CartesianVector(object):
     """A 3D Cartesian vector.
 
@@ -1899,6 +3353,8 @@ class CartesianVector(object):
     from_s
 
     """
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x=0.0, y=0.0, z=0.0):
         self.x = x
         self.y = y
@@ -2004,35 +3460,39 @@ def normalize_sphere(alpha, delta):
 
 
 class AlphaAngleSphere(AlphaAngle):
+    __slots__ = ('_ap',)
+
     def __init__(self, ap):
         self._ap = ap
-        super(AlphaAngleSphere, self).__init__(h=r2h(ap._cv.normalized_angles[0]))
+        super(AlphaAngleSphere, self).__init__(h=r2h(ap._normalized_angles()[0]))
 
     def _getnorm(self):
         # When DeltaAngleSphere is changed it makes the change in _cv. We need
         # to get that change
-        return self._ap._cv.normalized_angles[0]
+        return self._ap._normalized_angles()[0]
 
     def _setnorm(self, val):
-        _, delta = self._ap._cv.normalized_angles
+        _, delta = self._ap._normalized_angles()
         self._ap._cv = CartesianVector.from_spherical(r=self._ap._cv.mod, alpha=val, delta=delta)
         # don't really need this step since _getnorm above
-        self._raw = self._ap._cv.normalized_angles[0]
+        self._raw = self._ap._normalized_angles()[0]
 
 
 class DeltaAngleSphere(DeltaAngle):
+    __slots__ = ('_ap',)
+
     def __init__(self, ap):
         self._ap = ap
-        super(DeltaAngleSphere, self).__init__(d=r2d(ap._cv.normalized_angles[1]))
+        super(DeltaAngleSphere, self).__init__(d=r2d(ap._normalized_angles()[1]))
 
     def _getnorm(self):
-        return self._ap._cv.normalized_angles[1]
+        return self._ap._normalized_angles()[1]
 
     def _setnorm(self, val):
-        alpha, _ = self._ap._cv.normalized_angles
+        alpha, _ = self._ap._normalized_angles()
         self._ap._cv = CartesianVector.from_spherical(r=self._ap._cv.mod, alpha=alpha, delta=val)
         # don't really need this step since _getnorm above
-        self._raw = self._ap._cv.normalized_angles[1]
+        self._raw = self._ap._normalized_angles()[1]
 
 
 class AngularPosition(object):
@@ -2143,14 +3603,36 @@ class AngularPosition(object):
     >>> print(pos1)
     +00HH 00MM 00.000SS | +90DD 00MM 00.000SS
 
+    The normalized angles are calculated from the underlying Cartesian
+    vector only when the vector is replaced, for example when `alpha` or
+    `delta` is set, and are cached till then.
+
     """
-    dlim = " "
+    __slots__ = ('_vec', '_norm', '_alpha', '_delta', 'dlim')
 
     def __init__(self, alpha=0.0, delta=0.0):
+        self.dlim = " "
         self._cv = CartesianVector.from_spherical(r=1.0, alpha=d2r(alpha), delta=d2r(delta))
         self._alpha = AlphaAngleSphere(self)
         self._delta = DeltaAngleSphere(self)
 
+    @property
+    def _cv(self):
+        return self._vec
+
+    @_cv.setter
+    def _cv(self, v):
+        self._vec = v
+        self._norm = None
+
+    def _normalized_angles(self):
+        # Cached value of self._cv.normalized_angles, in radians. This is
+        # reset when _cv is replaced, but not if the components of _cv
+        # are changed in place.
+        if self._norm is None:
+            self._norm = self._cv.normalized_angles
+        return self._norm
+
     @classmethod
     def from_hd(cls, hd):
         if not isinstance(hd, str):
@@ -2159,27 +3641,7 @@ class AngularPosition(object):
         # There are several possible combination of units in the
         # string. For simplicity, use set of rules to get alpha
         # value in hours and delta value in degrees.
-        r = pposition(hd, details=True)
-        if r['numvals'] == 6:
-            raw_x = r['raw_x']
-            if raw_x['units'] == "degrees" and ("d" in hd or "dd" in hd):
-                # phmsdms called by pposition returns degrees if "hh"
-                # or "h" is not in hd. We want the reverse here.
-                # Assume degrees only if "d" or "dd" is present in hd.
-                x = r['x']
-            else:
-                # Assume that this is hours.
-                x = h2d(r['x'])
-
-            raw_y = r['raw_y']
-            if raw_y['units'] == "hours":
-                y = h2d(r['y'])
-            else:
-                y = r['y']  # Assume degrees.
-
-        else:
-            x = h2d(r['x'])
-            y = r['y']
+        x, y = _hd2deg(hd)
 
         return cls(alpha=x, delta=y)
 
@@ -2234,3 +3696,1465 @@ class AngularPosition(object):
 
     def __str__(self):
         return "{0}{1}{2}".format(str(self.alpha), self.dlim, str(self.delta))
+
+
+# Types of the scalars most often passed to ReferencePoint; checked
+# before the slower test in _is_real().
+_SCALARS = (float, int)
+
+
+def _is_real(*args):
+    # True if all the arguments are real numbers, including NumPy
+    # scalars such as numpy.int64, rather than sequences or arrays.
+    import numbers
+    return all(isinstance(i, numbers.Real) for i in args)
+
+
+class ReferencePoint(object):
+    """A point on a unit sphere, for separations and bearings to many points.
+
+    The vectors that `sep` and `bear` calculate for the first point are
+    calculated once, when the object is created, and are reused for
+    every call to `sep_to` and `bear_to`.
+
+    Parameters
+    ----------
+    alpha, delta : float
+        Longitude-like and latitude-like angles of the point, in
+        radians.
+
+    Attributes
+    ----------
+    v : tuple of 3 floats
+        Unit vector of the point; see `unit_vector`.
+    v10 : tuple of 3 floats
+        Vector perpendicular to the plane containing the point and the
+        z-axis, i.e., the normal of the meridian plane of the point.
+    on_pole : bool
+        True if the point is on a pole, where bearings are undefined.
+
+    Methods
+    -------
+    sep_to : separations to other points.
+    bear_to : bearings/position angles of other points.
+    from_position : create from an AngularPosition.
+
+    Notes
+    -----
+    For scalar inputs, which include NumPy scalars, the results are
+    floats identical to those from `sep` and `bear`. For arrays, which
+    need NumPy, they are identical to those from `sep_array` and
+    `bear_array`.
+
+    See also
+    --------
+    sep
+    bear
+
+    Examples
+    --------
+    >>> ref = ReferencePoint(d2r(45.0), d2r(45.0))
+    >>> ref.sep_to(d2r(45.0), d2r(-45.0)) == sep(d2r(45.0), d2r(45.0), d2r(45.0), d2r(-45.0))
+    True
+    >>> r2d(ref.bear_to(d2r(46.0), d2r(45.0)))
+    89.64644212193384
+    >>> x, undefined = ref.bear_to([d2r(46.0), d2r(44.0)], d2r(45.0))
+    >>> [round(r2d(i), 8) for i in x], undefined.tolist()
+    ([89.64644212, -89.64644212], [False, False])
+
+    """
+    __slots__ = ('v', 'v10', 'on_pole')
+
+    def __init__(self, alpha, delta):
+        self.v = unit_vector(alpha, delta)
+        # Same as in bear_vec().
+        self.v10 = _meridian_normal(self.v)
+        self.on_pole = math.sqrt(sum(i ** 2 for i in self.v10)) < 1e-15
+
+    @classmethod
+    def from_position(cls, p):
+        """Create from an AngularPosition.
+
+        The results are then identical to those from `AngularPosition.sep`
+        and `AngularPosition.bear`.
+        """
+        return cls(p.alpha.r, p.delta.r)
+
+    def sep_to(self, alpha, delta):
+        """Angular separations, in radians, to the given points.
+
+        Parameters
+        ----------
+        alpha, delta : float or array_like
+            Longitude-like and latitude-like angles of the points, in
+            radians.
+
+        Returns
+        -------
+        s : float or numpy.ndarray
+            See `sep` and `sep_array`.
+
+        """
+        if not (isinstance(alpha, _SCALARS) and isinstance(delta, _SCALARS)
+                or _is_real(alpha, delta)):
+            return _sep_xyz(self.v, _unit_vectors(alpha, delta))
+        # Same steps as in unit_vector() and sep_vec(), without the calls.
+        x1, y1, z1 = self.v
+        cd = math.cos(delta)
+        x2 = cd * math.cos(alpha)
+        y2 = cd * math.sin(alpha)
+        z2 = math.sin(delta)
+        cx = y1 * z2 - z1 * y2
+        cy = -(x1 * z2 - z1 * x2)
+        cz = x1 * y2 - y1 * x2
+        res = math.atan2(math.sqrt(cx ** 2 + cy ** 2 + cz ** 2),
+                         x1 * x2 + y1 * y2 + z1 * z2)
+        if abs(res) < 1e-15:
+            return 0.0
+        return res
+
+    def bear_to(self, alpha, delta):
+        """Bearings, or position angles, in radians, of the given points.
+
+        Parameters
+        ----------
+        alpha, delta : float or array_like
+            Longitude-like and latitude-like angles of the points, in
+            radians.
+
+        Returns
+        -------
+        x : float
+            For scalar inputs, the bearing; see `bear`.
+        x, undefined : numpy.ndarray
+            For arrays, the bearings and the mask of undefined bearings;
+            see `bear_array`.
+
+        """
+        if (isinstance(alpha, _SCALARS) and isinstance(delta, _SCALARS)
+                or _is_real(alpha, delta)):
+            if self.on_pole:
+                warnings.warn(
+                    "First point is on the pole. Bearing undefined.")
+                return 0.0
+            return _bear_vec(self.v, self.v10, unit_vector(alpha, delta))
+        return _bear_xyz(self.v, _unit_vectors(alpha, delta))
+
+
+class AngleArray(object):
+    """An array of angles, designed to be used with AngularPositionArray.
+
+    The values, in radians, are stored in a NumPy array. The values in
+    other units are available as attributes.
+
+    Attributes
+    ----------
+    r : numpy.ndarray
+        Angles in radians.
+    d : numpy.ndarray
+        Angles in degrees.
+    h : numpy.ndarray
+        Angles in hours.
+    arcs : numpy.ndarray
+        Angles in arc-seconds.
+
+    """
+    def __init__(self, r):
+        self._r = r
+
+    @property
+    def r(self):
+        return self._r
+
+    @property
+    def d(self):
+        return self._r * (180.0 / math.pi)
+
+    @property
+    def h(self):
+        return self.d * (24.0 / 360.0)
+
+    @property
+    def arcs(self):
+        return self.d * 3600.0
+
+    def __len__(self):
+        return len(self._r)
+
+    def __repr__(self):
+        return repr(self._r)
+
+
+class AngularPositionArray(object):
+    """Class for representing an array of points on a unit sphere.
+
+    This is a compact alternative to a list of `AngularPosition`
+    objects. The points are stored as a single NumPy array of shape (n,
+    3), holding the Cartesian components of the unit vectors. It needs
+    NumPy.
+
+    Parameters
+    ----------
+    alpha: array of longitude/ra like angles in degrees
+    delta: array of latitude/dec like angles in degrees
+
+    Attributes
+    ----------
+    xyz : numpy.ndarray
+        The (n, 3) array of unit vectors.
+    alpha : AngleArray
+        The longitude like angles, normalized as in `AngularPosition`.
+    delta : AngleArray
+        The latitude like angles, normalized as in `AngularPosition`.
+
+    Methods
+    -------
+    sep : return great circle separations in radians.
+    bear : return bearings/position angles in radians.
+    pixels : return HEALPix pixel indices.
+    from_vectors : create from an array of unit vectors.
+    from_positions : create from a sequence of AngularPosition objects.
+    to_positions : return a list of AngularPosition objects.
+
+    Notes
+    -----
+    Indexing with an integer returns an `AngularPosition`. Indexing with
+    a slice returns an `AngularPositionArray` that shares the unit
+    vectors with this one; nothing is copied. Indexing with an array of
+    indices or a boolean mask follows NumPy rules, and hence copies.
+
+    The unit vectors are not changed by this class, and must not be
+    changed in place through `xyz`. The angles in `alpha` and `delta`
+    are computed together, on first use, and remembered; the arrays are
+    read-only.
+
+    See also
+    --------
+    AngularPosition
+
+    Examples
+    --------
+    >>> a = AngularPositionArray(alpha=[165, 10, 20], delta=[-91, 45, 90])
+    >>> len(a)
+    3
+    >>> a.alpha.d.round(12).tolist(), a.delta.d.round(12).tolist()
+    ([345.0, 10.0, 20.0], [-89.0, 45.0, 90.0])
+    >>> a.alpha.h.round(12).tolist()
+    [23.0, 0.666666666667, 1.333333333333]
+    >>> print(a[1])
+    +00HH 40MM 00.000SS +45DD 00MM 00.000SS
+    >>> b = a[1:]
+    >>> b.xyz.base is a.xyz.base
+    True
+    >>> [round(r2d(i), 9) for i in a.sep(a[1]).tolist()]
+    [134.092165842, 0.0, 45.0]
+    >>> x, undefined = a.bear(AngularPosition(alpha=11, delta=46))
+    >>> [round(r2d(i), 9) for i in x.tolist()], undefined.tolist()
+    ([25.556670342, 34.671351863, 0.0], [False, False, True])
+
+    """
+    def __init__(self, alpha=(), delta=()):
+        np = _numpy()
+        x, y, z = _unit_vectors(np.radians(np.asarray(alpha, dtype=np.float64)),
+                                np.radians(np.asarray(delta, dtype=np.float64)))
+        xyz = np.empty(x.shape + (3,))
+        xyz[..., 0] = x
+        xyz[..., 1] = y
+        xyz[..., 2] = z
+        self._xyz = xyz.reshape(-1, 3)
+        self._angles = None
+
+    @classmethod
+    def from_vectors(cls, xyz):
+        """Create from an array of unit vectors of shape (n, 3).
+
+        The array is used as it is, without making a copy, if it is a
+        float64 array; the vectors are assumed to be of unit length.
+        """
+        np = _numpy()
+        xyz = np.asarray(xyz, dtype=np.float64)
+        if xyz.ndim != 2 or xyz.shape[1] != 3:
+            raise ValueError("xyz must be of shape (n, 3).")
+        a = cls.__new__(cls)
+        a._xyz = xyz
+        a._angles = None
+        return a
+
+    @classmethod
+    def from_positions(cls, positions):
+        """Create from a sequence of AngularPosition objects."""
+        np = _numpy()
+        xyz = np.array([(p._cv.x, p._cv.y, p._cv.z) for p in positions],
+                       dtype=np.float64)
+        return cls.from_vectors(xyz.reshape(-1, 3))
+
+    def to_positions(self):
+        """Return a list of AngularPosition objects."""
+        return [AngularPosition(alpha=a, delta=d) for a, d in
+                zip(self.alpha.d.tolist(), self.delta.d.tolist())]
+
+    @property
+    def xyz(self):
+        return self._xyz
+
+    def _normalized_angles(self):
+        # Same steps as in CartesianVector.normalized_angles, done once
+        # for both angles.
+        if self._angles is not None:
+            return self._angles
+        np = _numpy()
+        x, y, z = self._xyz.T
+        r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        alpha = np.arctan2(y, x)
+        delta = np.where(r < 1e-15, math.pi / 2.0,
+                         np.arcsin(z / np.where(r < 1e-15, 1.0, r)))
+        alpha = normalize_array(np.degrees(alpha), lower=0, upper=360)
+        delta = normalize_array(np.degrees(delta), lower=-90, upper=90, b=True)
+        alpha, delta = np.radians(alpha), np.radians(delta)
+        alpha.flags.writeable = False
+        delta.flags.writeable = False
+        self._angles = (alpha, delta)
+        return self._angles
+
+    @property
+    def alpha(self):
+        return AngleArray(self._normalized_angles()[0])
+
+    @property
+    def delta(self):
+        return AngleArray(self._normalized_angles()[1])
+
+    def __len__(self):
+        return len(self._xyz)
+
+    def __getitem__(self, key):
+        xyz = self._xyz[key]
+        if xyz.ndim == 1:
+            p = AngularPosition()
+            p._cv = CartesianVector(*xyz.tolist())
+            return p
+        return self.from_vectors(xyz)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _vectors(self, p):
+        # Unit vectors of p as a tuple of arrays that broadcast against
+        # those of self.
+        if isinstance(p, AngularPosition):
+            return (p._cv.x, p._cv.y, p._cv.z)
+        return tuple(p._xyz.T)
+
+    def sep(self, p):
+        """Angular separations, in radians, to p.
+
+        Parameters
+        ----------
+        p : AngularPosition or AngularPositionArray
+            If this is an `AngularPositionArray` then it must have the
+            same length as this array, or length 1.
+
+        See also
+        --------
+        sep_array
+
+        """
+        return _sep_xyz(tuple(self._xyz.T), self._vectors(p))
+
+    def bear(self, p):
+        """Position angles, in radians, of p w.r.t. these points.
+
+        Parameters
+        ----------
+        p : AngularPosition or AngularPositionArray
+            If this is an `AngularPositionArray` then it must have the
+            same length as this array, or length 1.
+
+        Returns
+        -------
+        x, undefined : numpy.ndarray
+            See `bear_array`.
+
+        See also
+        --------
+        bear_array
+
+        """
+        return _bear_xyz(tuple(self._xyz.T), self._vectors(p))
+
+    def pixels(self, nside):
+        """HEALPix pixel indices, in the "nested" scheme, of these points.
+
+        The indices are computed from the unit vectors, and are the same
+        as those from `ang2pix` applied to `alpha.r` and `delta.r`.
+
+        See also
+        --------
+        ang2pix
+
+        """
+        np = _numpy()
+        _check_nside(nside)
+        x, y, z = self._xyz.T
+        return _zphi2pix(np.clip(z, -1.0, 1.0), np.hypot(x, y),
+                         np.arctan2(y, x), nside)
+
+
+class AngularKDTree(object):
+    """A k-d tree of points on a unit sphere, for cone searches.
+
+    The tree is built over the unit vectors of the points, i.e., the
+    same representation as in `CartesianVector.from_spherical` and
+    `AngularPositionArray`. It needs NumPy.
+
+    Parameters
+    ----------
+    positions : AngularPositionArray or sequence of AngularPosition
+        The points to be indexed.
+    leafsize : int
+        Maximum number of points in a leaf node of the tree. Default is
+        16.
+
+    Attributes
+    ----------
+    positions : AngularPositionArray
+        The indexed points. The indices returned by the query methods
+        refer to these.
+
+    Methods
+    -------
+    query_radius : points within an angular distance of a position.
+    query : the k nearest points to a position.
+
+    Notes
+    -----
+    The tree is balanced: each node is split at the median along the
+    axis of its largest extent, and each node stores the bounding box
+    of its points.
+
+    An angular radius r corresponds to a straight line, or chord,
+    distance of 2 sin(r/2) between unit vectors, and the tree is
+    searched using the chord distance. The separations of the points
+    found are then calculated with `AngularPositionArray.sep`. This can
+    differ from `AngularPosition.sep` by a few units in the last place,
+    so for points within 1e-12 radians of the radius, the separation
+    is recalculated with `AngularPosition.sep`, and this is used for
+    the final selection. So a point ``p`` is found by `query_radius`
+    exactly when ``q.sep(p) <= r``, where ``p`` is the `AngularPosition`
+    from indexing `positions`.
+
+    Examples
+    --------
+    >>> cat = AngularPositionArray(alpha=[10, 10.5, 11, 200], delta=[45, 45, 45, -30])
+    >>> tree = AngularKDTree(cat)
+    >>> idx, s = tree.query_radius(AngularPosition(alpha=10.1, delta=45), d2r(0.5))
+    >>> idx.tolist(), [round(r2d(i), 6) for i in s]
+    ([0, 1], [0.070711, 0.282842])
+    >>> idx, s = tree.query(AngularPosition(alpha=190, delta=-45), k=2)
+    >>> idx.tolist(), [round(r2d(i), 6) for i in s]
+    ([3, 2], [16.937618, 179.292898])
+
+    """
+    def __init__(self, positions, leafsize=16):
+        np = _numpy()
+        if not isinstance(positions, AngularPositionArray):
+            positions = AngularPositionArray.from_positions(positions)
+        if leafsize < 1:
+            raise ValueError("leafsize must be positive.")
+        self.positions = positions
+        self.leafsize = leafsize
+
+        xyz = positions.xyz
+        self._idx = np.arange(len(xyz))
+        # Node data; node 0 is the root. A node covers the range
+        # _lo[i]:_hi[i] of _idx. Leaf nodes have _left[i] == -1.
+        self._lo = []
+        self._hi = []
+        self._left = []
+        self._right = []
+        self._bmin = []
+        self._bmax = []
+        if len(xyz):
+            self._build(xyz, 0, len(xyz))
+        # Vectors in tree order, so that each node is a slice.
+        self._xyz = xyz[self._idx]
+
+    def _build(self, xyz, lo, hi):
+        np = _numpy()
+        node = len(self._lo)
+        pts = xyz[self._idx[lo:hi]]
+        bmin = pts.min(axis=0)
+        bmax = pts.max(axis=0)
+        self._lo.append(lo)
+        self._hi.append(hi)
+        self._left.append(-1)
+        self._right.append(-1)
+        self._bmin.append(tuple(bmin.tolist()))
+        self._bmax.append(tuple(bmax.tolist()))
+        if hi - lo > self.leafsize:
+            axis = int(np.argmax(bmax - bmin))
+            mid = (lo + hi) // 2
+            order = np.argpartition(pts[:, axis], mid - lo)
+            self._idx[lo:hi] = self._idx[lo:hi][order]
+            self._left[node] = self._build(xyz, lo, mid)
+            self._right[node] = self._build(xyz, mid, hi)
+        return node
+
+    def _ball(self, q, c2):
+        # Ranges of tree order that may contain vectors within squared
+        # chord distance c2 of the vector q.
+        ranges = []
+        stack = [0] if self._lo else []
+        while stack:
+            node = stack.pop()
+            bmin = self._bmin[node]
+            bmax = self._bmax[node]
+            near = 0.0
+            far = 0.0
+            for k in (0, 1, 2):
+                a = bmin[k] - q[k]
+                b = q[k] - bmax[k]
+                if a > 0:
+                    near += a * a
+                elif b > 0:
+                    near += b * b
+                t = max(-a, -b)
+                far += t * t
+            if near > c2:
+                continue
+            if far <= c2 or self._left[node] == -1:
+                ranges.append((self._lo[node], self._hi[node]))
+            else:
+                stack.append(self._left[node])
+                stack.append(self._right[node])
+        return ranges
+
+    def _select(self, q, c2):
+        # Indices into tree order, and separations, for the ranges
+        # returned by _ball().
+        np = _numpy()
+        ranges = self._ball(q, c2)
+        if not ranges:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        i = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+        return i, _sep_xyz(q, tuple(self._xyz[i].T))
+
+    def _sorted(self, i, s):
+        # Original indices and separations, sorted on separation and
+        # then index.
+        np = _numpy()
+        i = self._idx[i]
+        order = np.lexsort((i, s))
+        return i[order], s[order]
+
+    @staticmethod
+    def _vectors(p):
+        # List of query vectors, and whether there is only one.
+        if isinstance(p, AngularPosition):
+            return [(p._cv.x, p._cv.y, p._cv.z)], True
+        return [tuple(i) for i in p.xyz.tolist()], False
+
+    def query_radius(self, p, r):
+        """Find points within angular distance r of p.
+
+        Parameters
+        ----------
+        p : AngularPosition or AngularPositionArray
+            Query position, or positions.
+        r : float
+            Radius of the cone, in radians.
+
+        Returns
+        -------
+        idx, s : numpy.ndarray
+            Indices of the points, and their separations from p, in
+            radians, sorted on separation. Points at a separation equal
+            to `r` are included. If `p` is an `AngularPositionArray` then
+            a list of these tuples, one for each position, is returned.
+
+        Notes
+        -----
+        See the notes for the class on how points at a separation close
+        to `r` are handled.
+
+        """
+        np = _numpy()
+        if r >= math.pi:
+            c2 = float("inf")
+        else:
+            c = 2.0 * math.sin(max(r, 0.0) / 2.0)
+            c2 = (c * (1 + 1e-9) + 1e-12) ** 2
+
+        result = []
+        vectors, single = self._vectors(p)
+        for k, q in enumerate(vectors):
+            i, s = self._select(q, c2)
+            # Points close to the radius are decided using the scalar
+            # separation.
+            for j in np.flatnonzero(np.abs(s - r) <= 1e-12).tolist():
+                pk = p if single else p[k]
+                s[j] = pk.sep(self.positions[int(self._idx[i[j]])])
+            keep = s <= r
+            result.append(self._sorted(i[keep], s[keep]))
+        return result[0] if single else result
+
+    def _kth_chord2(self, q, k):
+        # Squared chord distance of the k-th nearest vector to q, using a
+        # best first search.
+        import heapq
+        np = _numpy()
+        best = np.zeros(0)
+        heap = [(0.0, 0)]
+        while heap:
+            near, node = heapq.heappop(heap)
+            if len(best) == k and near > best[-1]:
+                break
+            if self._left[node] == -1:
+                pts = self._xyz[self._lo[node]:self._hi[node]]
+                d = ((pts - q) ** 2).sum(axis=1)
+                best = np.sort(np.concatenate((best, d)))[:k]
+                continue
+            for child in (self._left[node], self._right[node]):
+                bmin = self._bmin[child]
+                bmax = self._bmax[child]
+                near = 0.0
+                for j in (0, 1, 2):
+                    t = max(bmin[j] - q[j], q[j] - bmax[j], 0.0)
+                    near += t * t
+                heapq.heappush(heap, (near, child))
+        return best[-1]
+
+    def query(self, p, k=1):
+        """Find the k nearest points to p.
+
+        Parameters
+        ----------
+        p : AngularPosition or AngularPositionArray
+            Query position, or positions.
+        k : int
+            Number of points to find. Default is 1.
+
+        Returns
+        -------
+        idx, s : numpy.ndarray
+            Indices of the nearest points, and their separations from
+            p, in radians, sorted on separation. Points at equal
+            separation are ordered by index. There are fewer than `k`
+            values only if the tree has fewer than `k` points. If `p`
+            is an `AngularPositionArray` then both are arrays of shape
+            (len(p), min(k, n)).
+
+        """
+        np = _numpy()
+        if k < 1:
+            raise ValueError("k must be positive.")
+
+        n = min(k, len(self._xyz))
+        idx = []
+        sep = []
+        vectors, single = self._vectors(p)
+        for q in vectors:
+            if n:
+                # The search on chord distance finds the distance to the
+                # k-th point. All points around that distance are then
+                # ranked on separation.
+                c2 = self._kth_chord2(q, n)
+                i, s = self._sorted(*self._select(q, c2 * (1 + 1e-9) + 1e-24))
+            else:
+                i, s = np.zeros(0, dtype=np.int64), np.zeros(0)
+            idx.append(i[:n])
+            sep.append(s[:n])
+
+        if single:
+            return idx[0], sep[0]
+        return (np.array(idx, dtype=np.int64).reshape(len(idx), n),
+                np.array(sep).reshape(len(sep), n))
+
+
+# Data for the HEALPix nested scheme: ring number, in units of nside, of
+# the southmost corner of each base pixel, and its longitude in units of
+# π/4.
+_JRLL = (2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4)
+_JPLL = (1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7)
+
+
+def _check_nside(nside):
+    if not (1 <= nside <= 2 ** 29 and nside & (nside - 1) == 0):
+        raise ValueError("nside must be a power of 2, between 1 and 2**29.")
+
+
+def _spread_bits(v):
+    # Insert a 0 bit between the bits of v: abcd => 0a0b0c0d.
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def _compress_bits(v):
+    # Inverse of _spread_bits for the even bits of v.
+    v = v & 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    return (v | (v >> 16)) & 0x00000000FFFFFFFF
+
+
+def nside2npix(nside):
+    """Number of pixels in the HEALPix pixelization of given resolution."""
+    _check_nside(nside)
+    return 12 * nside * nside
+
+
+def _zphi2pix(z, cosd, phi, nside):
+    # Nested HEALPix pixel index from the sine and cosine of the
+    # latitude like angle, and the longitude like angle in radians.
+    np = _numpy()
+    za = np.abs(z)
+    tt = np.mod(phi * (2.0 / math.pi), 4.0)  # [0, 4)
+    tt = np.where(tt >= 4.0, 0.0, tt)
+
+    # Equatorial region, |z| <= 2/3.
+    t1 = nside * (0.5 + tt)
+    t2 = nside * (z * 0.75)
+    jp = (t1 - t2).astype(np.int64)  # index of ascending edge line
+    jm = (t1 + t2).astype(np.int64)  # index of descending edge line
+    ifp = jp // nside
+    ifm = jm // nside
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps. sqrt(3 (1 - |z|)) is written in terms of cos(delta)
+    # for accuracy close to the poles.
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * cosd * np.sqrt(3.0 / (1.0 + za))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_p = np.where(north, ntt, ntt + 8)
+    ix_p = np.where(north, nside - jm - 1, jp)
+    iy_p = np.where(north, nside - jp - 1, jm)
+
+    eq = za <= 2.0 / 3.0
+    face = np.where(eq, face_eq, face_p)
+    ix = np.where(eq, ix_eq, ix_p)
+    iy = np.where(eq, iy_eq, iy_p)
+    return face * (nside * nside) + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def ang2pix(alpha, delta, nside):
+    """HEALPix pixel indices of points on a sphere.
+
+    The sphere is divided into 12 * nside**2 pixels of equal area, in
+    the HEALPix "nested" scheme. This needs NumPy.
+
+    Parameters
+    ----------
+    alpha, delta : array_like
+        Longitude-like and latitude-like angles of the points, in
+        radians.
+    nside : int
+        Resolution of the pixelization. This must be a power of 2.
+
+    Returns
+    -------
+    pix : numpy.ndarray
+        Integer pixel indices in the range [0, 12 * nside**2).
+
+    Notes
+    -----
+    In the nested scheme, the pixels 4p, 4p+1, 4p+2 and 4p+3 at
+    resolution 2 * nside are the pixels that make up pixel p at
+    resolution nside. So the pixel index of a point at a lower
+    resolution is found by dropping bits from the index.
+
+    The angles need not be normalized; the point is the one given by
+    `CartesianVector.from_spherical`, so that a `delta` beyond ±π/2
+    moves the point to `alpha` + π.
+
+    See also
+    --------
+    pix2ang
+    cone_pixels
+
+    Examples
+    --------
+    >>> ang2pix([0.0, d2r(90.0), d2r(300.0)], [d2r(90.0), 0.0, d2r(-60.0)], 1).tolist()
+    [0, 5, 11]
+    >>> (ang2pix(d2r(50.0), d2r(10.0), 4) // 16).tolist()
+    0
+
+    """
+    np = _numpy()
+    _check_nside(nside)
+    x, y, z = _unit_vectors(np.asarray(alpha, dtype=np.float64),
+                            np.asarray(delta, dtype=np.float64))
+    return _zphi2pix(np.clip(z, -1.0, 1.0), np.hypot(x, y),
+                     np.arctan2(y, x), nside)
+
+
+def pix2ang(pix, nside):
+    """Centers of HEALPix pixels.
+
+    This is the inverse of `ang2pix`. This needs NumPy.
+
+    Parameters
+    ----------
+    pix : array_like
+        Pixel indices in the "nested" scheme.
+    nside : int
+        Resolution of the pixelization. This must be a power of 2.
+
+    Returns
+    -------
+    alpha, delta : numpy.ndarray
+        Longitude-like and latitude-like angles of the centers of the
+        pixels, in radians. `alpha` is in [0, 2π) and `delta` in
+        [-π/2, π/2], as for `AlphaAngle` and `DeltaAngle`.
+
+    Raises
+    ------
+    ValueError
+        If any pixel index is not in the range [0, 12 * nside**2).
+
+    See also
+    --------
+    ang2pix
+
+    Examples
+    --------
+    >>> alpha, delta = pix2ang([0, 4, 11], 1)
+    >>> [round(r2d(i), 6) for i in alpha], [round(r2d(i), 6) for i in delta]
+    ([45.0, 0.0, 315.0], [41.810315, 0.0, -41.810315])
+
+    """
+    np = _numpy()
+    _check_nside(nside)
+    pix = np.asarray(pix, dtype=np.int64)
+    npface = nside * nside
+    if pix.size and (pix.min() < 0 or pix.max() >= 12 * npface):
+        raise ValueError("Pixel index out of range for nside.")
+
+    face = pix // npface
+    ix = _compress_bits(pix & (npface - 1))
+    iy = _compress_bits((pix & (npface - 1)) >> 1)
+
+    jr = np.take(_JRLL, face) * nside - ix - iy - 1
+    north = jr < nside
+    south = jr > 3 * nside
+    nr = np.where(north, jr, np.where(south, 4 * nside - jr, nside))
+    kshift = np.where(north | south, 0, (jr - nside) & 1)
+
+    # Latitude: in the polar caps 1 - |z| = nr**2 / (3 nside**2).
+    delta = np.where(
+        north | south,
+        math.pi / 2 - 2 * np.arcsin(nr / (math.sqrt(6.0) * nside)),
+        np.arcsin(np.clip((2 * nside - jr) * (2.0 / (3.0 * nside)), -1, 1)))
+    delta = np.where(south, -delta, delta)
+
+    jp = (np.take(_JPLL, face) * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, jp)
+    jp = np.where(jp < 1, jp + 4 * nside, jp)
+    alpha = (jp - (kshift + 1) * 0.5) * ((math.pi / 2) / nr)
+    return alpha, delta
+
+
+def _max_pixrad(nside):
+    # Largest angular distance between the center and a corner of any
+    # pixel, in radians.
+    va = CartesianVector.from_spherical(
+        1.0, math.pi / (4 * nside), math.asin(2.0 / 3.0))
+    t1 = (1.0 - 1.0 / nside) ** 2
+    vb = CartesianVector.from_spherical(1.0, 0.0, math.asin(1 - t1 / 3.0))
+    return math.atan2(va.cross(vb).mod, va.dot(vb))
+
+
+def cone_pixels(alpha, delta, radius, nside):
+    """HEALPix pixels that overlap a cone.
+
+    This needs NumPy.
+
+    Parameters
+    ----------
+    alpha, delta : float
+        Longitude-like and latitude-like angles of the center of the
+        cone, in radians.
+    radius : float
+        Radius of the cone, in radians.
+    nside : int
+        Resolution of the pixelization. This must be a power of 2.
+
+    Returns
+    -------
+    pix : numpy.ndarray
+        Sorted pixel indices, in the "nested" scheme.
+
+    Notes
+    -----
+    The search starts with the 12 base pixels and moves down to the
+    required resolution, keeping at each level only those pixels whose
+    center is within `radius` plus the largest pixel radius at that
+    level. So all the pixels that overlap the cone are returned, and a
+    few pixels that are just outside it may also be returned. All the
+    points within the cone are in these pixels, so that a cone search
+    need only look at the points in these pixels.
+
+    See also
+    --------
+    ang2pix
+
+    Examples
+    --------
+    >>> p = cone_pixels(0.0, d2r(90.0), d2r(10.0), 8)
+    >>> len(p), int(ang2pix(1.0, d2r(85.0), 8)) in p
+    (12, True)
+
+    """
+    np = _numpy()
+    _check_nside(nside)
+    v = _unit_vectors(np.float64(alpha), np.float64(delta))
+    pix = np.arange(12, dtype=np.int64)
+    n = 1
+    while True:
+        a, d = pix2ang(pix, n)
+        s = _sep_xyz(v, _unit_vectors(a, d))
+        pix = pix[s <= radius + _max_pixrad(n) + 1e-10]
+        if n == nside:
+            return pix
+        pix = (4 * pix[:, None] + np.arange(4)).ravel()
+        n *= 2
+
+
+def _ranges(lo, hi):
+    # Concatenation of arange(lo[i], hi[i]) over i, and the index i of
+    # each element.
+    np = _numpy()
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(lo)), counts)
+    start = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(start - lo, counts), owner
+
+
+def crossmatch(cat1, cat2, radius, nearest=True, chunksize=65536, workers=1):
+    """Match two catalogs of positions on a sphere.
+
+    For each point in `cat1`, find the points in `cat2` that are within
+    `radius` of it. This needs NumPy.
+
+    Parameters
+    ----------
+    cat1, cat2 : AngularPositionArray or sequence of AngularPosition
+        The two catalogs.
+    radius : float
+        Matching radius, in radians.
+    nearest : bool
+        If True, which is the default, then only the nearest match in
+        `cat2` is returned for each point in `cat1`. If False then all
+        the matches within `radius` are returned.
+    chunksize : int
+        Number of points of `cat1` processed at a time. This limits the
+        size of the temporary arrays. With more than one worker, this is
+        also the number of points of `cat1` in each task sent to a
+        worker.
+    workers : int
+        Number of worker processes. Default is 1, i.e., no worker
+        processes. If this is None then the number of CPUs is used.
+
+    Returns
+    -------
+    i1, i2 : numpy.ndarray
+        Indices of the matched points in `cat1` and `cat2`.
+    s : numpy.ndarray
+        Separations of the matched points, in radians. These are
+        calculated in the same way as in `AngularPositionArray.sep`,
+        except for pairs close to `radius`; see notes.
+
+    The matches are sorted by `i1`, then by `s` and finally by `i2`.
+    Points in `cat1` with no match do not appear in `i1`.
+
+    Raises
+    ------
+    ValueError
+        If `radius` is negative, or if `chunksize` or `workers` is not
+        positive.
+
+    Notes
+    -----
+    The points in `cat2` are put into declination zones of height
+    `radius`, and sorted by zone and by right ascension. A point in
+    `cat1` can only match points in its own zone and the two adjacent
+    ones. In each of these zones the candidates lie within a window in
+    right ascension, found by binary search. The half width of the
+    window is arcsin(sin(radius) / cos(delta)), which is radius /
+    cos(delta) for small radii; windows that extend beyond 0 or 2π are
+    wrapped around, and around the poles the whole zone is searched.
+    Only the candidates in the windows are compared to the point, so
+    the time taken is proportional to the number of matches plus
+    N log(M), for catalogs of N and M points, instead of N * M.
+
+    The separations from `AngularPositionArray.sep` can differ from
+    those from `AngularPosition.sep` by a few units in the last place.
+    For pairs within 1e-12 radians of `radius`, the separation is
+    recalculated with `AngularPosition.sep`, and this decides whether
+    the pair matches and is the value returned. So ``cat1[i]`` and
+    ``cat2[j]`` match exactly when ``cat1[i].sep(cat2[j]) <= radius``.
+
+    With more than one worker, `cat1` is sorted by declination and split
+    into bands of `chunksize` points. Each band, along with the points
+    of `cat2` whose declinations are within `radius` of the band, is
+    matched in a `multiprocessing.Pool` worker. Each point of `cat1` is
+    in exactly one band, and the margins ensure that all its matches
+    are in the band, so that merging the results of the bands gives
+    exactly the same output as matching in a single process.
+
+    See also
+    --------
+    AngularKDTree
+    sep_array
+
+    Examples
+    --------
+    >>> cat1 = AngularPositionArray(alpha=[10, 359.9995, 120], delta=[45, 0, 80])
+    >>> cat2 = AngularPositionArray(alpha=[10.0002, 10, 0.0004, 300], delta=[45, 45.0003, 0, 80])
+    >>> i1, i2, s = crossmatch(cat1, cat2, d2r(4 / 3600.0), nearest=False)
+    >>> i1.tolist(), i2.tolist(), [round(r2d(i) * 3600, 4) for i in s]
+    ([0, 0, 1], [0, 1, 2], [0.5091, 1.08, 3.24])
+
+    """
+    np = _numpy()
+    if radius < 0:
+        raise ValueError("radius must be non-negative.")
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive.")
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError("workers must be positive.")
+    if not isinstance(cat1, AngularPositionArray):
+        cat1 = AngularPositionArray.from_positions(cat1)
+    if not isinstance(cat2, AngularPositionArray):
+        cat2 = AngularPositionArray.from_positions(cat2)
+
+    if workers == 1 or len(cat1) <= chunksize:
+        return _crossmatch(cat1, cat2, radius, nearest, chunksize)
+
+    # Declination bands of cat1, and the overlapping parts of cat2.
+    d1 = cat1.delta.r
+    d2 = cat2.delta.r
+    order1 = np.argsort(d1, kind="mergesort")
+    order2 = np.argsort(d2, kind="mergesort")
+    sd2 = d2[order2]
+    margin = radius * (1 + 1e-9) + 1e-15
+    tasks = []
+    for start in range(0, len(cat1), chunksize):
+        idx1 = np.sort(order1[start:start + chunksize])
+        lo = np.searchsorted(sd2, d1[idx1].min() - margin, side="left")
+        hi = np.searchsorted(sd2, d1[idx1].max() + margin, side="right")
+        idx2 = np.sort(order2[lo:hi])
+        tasks.append((cat1.xyz[idx1], idx1, cat2.xyz[idx2], idx2, radius,
+                      nearest, chunksize))
+
+    import multiprocessing
+    pool = multiprocessing.Pool(min(workers, len(tasks)))
+    try:
+        res = pool.map(_crossmatch_band, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return _sort_matches(np.concatenate([i[0] for i in res]),
+                         np.concatenate([i[1] for i in res]),
+                         np.concatenate([i[2] for i in res]), nearest)
+
+
+def _crossmatch(cat1, cat2, radius, nearest, chunksize):
+    # Serial cross-match of two AngularPositionArray objects.
+    np = _numpy()
+    twopi = 2 * math.pi
+    # Zones are at least radius high; a floor on the height keeps the
+    # number of zones, and hence the sort keys below, bounded.
+    h = max(radius * (1 + 1e-9), math.pi / 2 ** 20)
+    nzones = int(math.pi / h) + 1
+
+    a2, d2 = cat2._normalized_angles()
+    zone2 = np.minimum(((d2 + math.pi / 2) / h).astype(np.int64),
+                       nzones - 1)
+    # Sort key: zone, then right ascension, which is in [0, 2π) < 8.
+    key = zone2 * 8.0 + a2
+    order = np.argsort(key, kind="mergesort")
+    key = key[order]
+    xyz2 = cat2.xyz[order]
+    eps = 4 * np.spacing(nzones * 8.0)
+
+    alpha1, delta1 = cat1._normalized_angles()
+    i1s, i2s, ss = [], [], []
+    for start in range(0, len(cat1), chunksize):
+        sub = cat1[start:start + chunksize]
+        a1 = alpha1[start:start + chunksize]
+        d1 = delta1[start:start + chunksize]
+        zone1 = np.minimum(((d1 + math.pi / 2) / h).astype(np.int64),
+                           nzones - 1)
+        cd = np.cos(d1)
+        polar = np.abs(d1) + radius >= math.pi / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = np.arcsin(np.minimum(math.sin(radius) / cd, 1.0))
+        w = np.where(polar, math.pi, w * (1 + 1e-9) + 1e-15)
+        full = w >= math.pi
+
+        los, his, empty = [], [], []
+        for dz in (-1, 0, 1):
+            z = (zone1 + dz) * 8.0
+            # The main window, and the parts of it that wrap around to
+            # the other end of the zone.
+            los.append(z + np.where(full, 0.0, np.maximum(a1 - w, 0.0)))
+            his.append(z + np.where(full, twopi, np.minimum(a1 + w, twopi)))
+            empty.append(np.zeros(len(sub), bool))
+            los.append(z + a1 - w + twopi)
+            his.append(z + twopi)
+            empty.append(full | (a1 - w >= 0))
+            los.append(z)
+            his.append(z + a1 + w - twopi)
+            empty.append(full | (a1 + w <= twopi))
+        lo = np.searchsorted(key, np.concatenate(los) - eps, side="left")
+        hi = np.searchsorted(key, np.concatenate(his) + eps, side="right")
+        hi = np.where(np.concatenate(empty), lo, np.maximum(hi, lo))
+        j, owner = _ranges(lo, hi)
+        i = owner % len(sub)
+        s = _sep_xyz(tuple(sub.xyz[i].T), tuple(xyz2[j].T))
+        # Pairs close to the radius are decided using the scalar
+        # separation.
+        for k in np.flatnonzero(np.abs(s - radius) <= 1e-12).tolist():
+            s[k] = sub[int(i[k])].sep(cat2[int(order[j[k]])])
+        m = s <= radius
+        i1s.append(i[m] + start)
+        i2s.append(order[j[m]])
+        ss.append(s[m])
+
+    i1 = np.concatenate(i1s) if i1s else np.zeros(0, np.int64)
+    i2 = np.concatenate(i2s) if i2s else np.zeros(0, np.int64)
+    s = np.concatenate(ss) if ss else np.zeros(0)
+    return _sort_matches(i1, i2, s, nearest)
+
+
+def _sort_matches(i1, i2, s, nearest):
+    # Sort matches by i1, s and i2, and remove duplicates. RA windows
+    # are widened by a tiny amount to allow for rounding, so the same
+    # pair may be found twice around RA 0.
+    np = _numpy()
+    idx = np.lexsort((i2, s, i1))
+    i1, i2, s = i1[idx], i2[idx], s[idx]
+    keep = np.ones(len(i1), bool)
+    keep[1:] = (i1[1:] != i1[:-1]) | (i2[1:] != i2[:-1])
+    if nearest:
+        keep[1:] &= i1[1:] != i1[:-1]
+    return i1[keep], i2[keep], s[keep]
+
+
+def _crossmatch_band(args):
+    # Worker for crossmatch: match one declination band. The indices
+    # of the points, idx1 and idx2, are sorted so that ties are broken
+    # in the same way as in a serial match.
+    xyz1, idx1, xyz2, idx2, radius, nearest, chunksize = args
+    i1, i2, s = _crossmatch(AngularPositionArray.from_vectors(xyz1),
+                            AngularPositionArray.from_vectors(xyz2),
+                            radius, nearest, chunksize)
+    return idx1[i1], idx2[i2], s
+
+
+def sep_matrix(p1, p2, out=None, max_bytes=2 ** 26):
+    """Angular separations between all pairs of points of two arrays.
+
+    This needs NumPy.
+
+    Parameters
+    ----------
+    p1, p2 : AngularPositionArray or sequence of AngularPosition
+        The two sets of points, of lengths N and M.
+    out : numpy.ndarray
+        Optional (N, M) floating point array, for example a
+        `numpy.memmap`, into which the separations are written.
+    max_bytes : int
+        Approximate limit, in bytes, on the temporary memory used.
+        Default is 64 MiB.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The (N, M) array of separations, in radians. `out[i, j]` is the
+        separation between `p1[i]` and `p2[j]`.
+
+    Raises
+    ------
+    ValueError
+        If `out` does not have the shape (N, M).
+
+    Notes
+    -----
+    The matrix is computed in blocks, with the number of rows and
+    columns in each block chosen so that the temporary arrays for a
+    block fit in `max_bytes`. For each block the dot products of the
+    unit vectors are computed as a matrix product, and the separations
+    are arccos of these. Close to 0 and π, where arccos is badly
+    conditioned, i.e., where the absolute value of the dot product is
+    more than 0.9, the separations are instead computed from both the
+    cross product and the dot product, in the same way as in `sep`.
+
+    See also
+    --------
+    sep
+    sep_array
+
+    Examples
+    --------
+    >>> p1 = AngularPositionArray(alpha=[0, 90], delta=[0, 0])
+    >>> p2 = AngularPositionArray(alpha=[0, 0, 180], delta=[0, 90, 1e-9])
+    >>> r2d(1) * sep_matrix(p1, p2).round(12)
+    array([[  0.,  90., 180.],
+           [ 90.,  90.,  90.]])
+
+    """
+    np = _numpy()
+    if not isinstance(p1, AngularPositionArray):
+        p1 = AngularPositionArray.from_positions(p1)
+    if not isinstance(p2, AngularPositionArray):
+        p2 = AngularPositionArray.from_positions(p2)
+    n, m = len(p1), len(p2)
+    if out is None:
+        out = np.empty((n, m))
+    elif out.shape != (n, m):
+        raise ValueError("out must have shape ({0}, {1}).".format(n, m))
+    if n == 0 or m == 0:
+        return out
+
+    # Half of max_bytes is for the blocks, which need about 3 temporary
+    # values of 8 bytes per element. The other half is for the elements
+    # close to 0 and π, which are done in groups of rows, or parts of a
+    # row, with at most `sub` such elements, so that the memory used
+    # does not depend on how many there are. Each needs indices,
+    # gathered vectors and the temporaries of _sep_xyz, about 24 values
+    # of 8 bytes.
+    size = max(1, int(max_bytes) // 48)
+    bc = min(m, size)
+    br = min(n, max(1, size // bc))
+    sub = max(1, int(max_bytes) // 384)
+    x1, x2 = p1.xyz, p2.xyz
+    for r0 in range(0, n, br):
+        v1 = x1[r0:r0 + br]
+        for c0 in range(0, m, bc):
+            v2 = x2[c0:c0 + bc]
+            d = np.dot(v1, v2.T)
+            res = np.clip(d, -1.0, 1.0)
+            np.arccos(res, out=res)
+            np.abs(d, out=d)
+            near = d > 0.9
+            del d
+            # Cumulative number of near elements at the end of each row.
+            cum = np.cumsum(np.count_nonzero(near, axis=1))
+            i0 = 0
+            while i0 < len(v1) and cum[-1] > (cum[i0 - 1] if i0 else 0):
+                i1 = int(np.searchsorted(
+                    cum, (cum[i0 - 1] if i0 else 0) + sub, side="right"))
+                if i1 > i0:
+                    cols = [(0, len(v2))]
+                else:
+                    i1 = i0 + 1
+                    cols = [(j0, j0 + sub) for j0 in range(0, len(v2), sub)]
+                for j0, j1 in cols:
+                    i, j = np.nonzero(near[i0:i1, j0:j1])
+                    if len(i):
+                        i += i0
+                        j += j0
+                        res[i, j] = _sep_xyz(tuple(v1[i].T), tuple(v2[j].T))
+                i0 = i1
+            out[r0:r0 + len(v1), c0:c0 + len(v2)] = res
+    return out
+
+
+# Instrumentation. When enabled, the functions and methods listed below
+# are replaced, in this module and in their classes, by wrappers that
+# count calls and record time taken. When disabled the originals are
+# put back, so that there is no cost at all.
+_STATS_FUNCTIONS = (
+    "normalize", "deci2sexa", "sexa2deci", "fmt_angle", "_phmsdms",
+    "_psexa", "pposition", "sep", "bear", "normalize_sphere")
+# Names under which some functions are reported. All the string parsing
+# is done by _phmsdms, which is called directly by pposition and
+# parse_many, and not only through the public phmsdms.
+_STATS_NAMES = {"_phmsdms": "phmsdms"}
+_STATS_METHODS = (
+    (Angle, "__init__"), (Angle, "_memo"),
+    (CartesianVector, "normalized_angles"),
+    (AngularPosition, "__init__"), (AngularPosition, "_normalized_angles"))
+_STATS_BINS = 24
+_stats = {}
+_stats_saved = {}
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def _instrument(name, f):
+    rec = _stats.setdefault(name, [0, 0.0, [0] * _STATS_BINS])
+
+    def wrapper(*args, **kwargs):
+        t0 = _clock()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            t = _clock() - t0
+            rec[0] += 1
+            rec[1] += t
+            rec[2][min(int(t * 1e6).bit_length(), _STATS_BINS - 1)] += 1
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+    return wrapper
+
+
+def enable_stats():
+    """Start counting calls to, and timing, the main internal functions.
+
+    The functions and methods that are instrumented include `normalize`,
+    `deci2sexa`, `fmt_angle`, `phmsdms`, `pposition`, `sep`, `bear`,
+    `Angle.__init__`, `AngularPosition.__init__` and
+    `CartesianVector.normalized_angles`; the last one shows how often
+    `AngularPosition` recalculates its normalized angles.
+
+    The entry for `phmsdms` counts all the parsing of sexagesimal
+    strings by `phmsdms` and `parse_many`, and by `pposition` for
+    angles that are not made of plain numbers. `pposition`, and hence
+    `AngularPosition.from_hd`, parses each angle of a position with
+    ``_psexa``, which has its own entry.
+
+    Notes
+    -----
+    The functions are replaced by wrappers in this module, and the
+    methods in their classes. Calls through names imported from this
+    module before this was called, e.g., with ``from angles import
+    normalize``, are not counted. `disable_stats` restores the original
+    functions, so that instrumentation costs nothing when disabled.
+
+    Instrumentation is also enabled when the module is imported, if the
+    environment variable ANGLES_STATS is set to a non-empty value other
+    than "0".
+
+    See also
+    --------
+    stats
+    collect_stats
+
+    """
+    if _stats_saved:
+        return
+    g = globals()
+    for name in _STATS_FUNCTIONS:
+        _stats_saved[name] = g[name]
+        g[name] = _instrument(_STATS_NAMES.get(name, name), g[name])
+    for cls, attr in _STATS_METHODS:
+        name = "{0}.{1}".format(cls.__name__, attr)
+        v = cls.__dict__[attr]
+        _stats_saved[name] = (cls, attr, v)
+        if isinstance(v, property):
+            w = property(_instrument(name, v.fget), v.fset, v.fdel, v.__doc__)
+        else:
+            w = _instrument(name, v)
+        setattr(cls, attr, w)
+
+
+def disable_stats():
+    """Stop instrumentation, and restore the original functions.
+
+    The statistics collected so far are kept; see `reset_stats`.
+    """
+    g = globals()
+    for name, v in _stats_saved.items():
+        if isinstance(v, tuple):
+            setattr(v[0], v[1], v[2])
+        else:
+            g[name] = v
+    _stats_saved.clear()
+
+
+def stats_enabled():
+    """True if instrumentation is enabled."""
+    return bool(_stats_saved)
+
+
+def reset_stats():
+    """Set all counts and times to zero."""
+    for rec in _stats.values():
+        rec[0] = 0
+        rec[1] = 0.0
+        rec[2][:] = [0] * _STATS_BINS
+
+
+def stats():
+    """Call counts and times of instrumented functions.
+
+    Returns
+    -------
+    s : dict
+        Keys are names of functions or methods, e.g., "phmsdms" or
+        "CartesianVector.normalized_angles", that have been called
+        while instrumentation was enabled. Each value is a dictionary
+        with the following items:
+
+        calls : int
+            Number of calls.
+        time : float
+            Total time taken by the calls, in seconds. This includes the
+            time spent in other instrumented functions.
+        hist : list of int
+            Histogram of the time per call. ``hist[0]`` is the number of
+            calls that took less than 1 microsecond, and ``hist[k]`` the
+            number that took from 2**(k-1) to 2**k microseconds. The
+            last bin also counts all the slower calls.
+
+    See also
+    --------
+    enable_stats
+    collect_stats
+
+    Examples
+    --------
+    >>> with collect_stats():
+    ...     x = AngularPosition.from_hd("12 22 54.899 +15 49 20.57")
+    >>> s = stats()
+    >>> s["AngularPosition.__init__"]["calls"], s["pposition"]["calls"]
+    (1, 1)
+    >>> sum(s["normalize"]["hist"]) == s["normalize"]["calls"]
+    True
+
+    """
+    return dict((k, dict(calls=v[0], time=v[1], hist=list(v[2])))
+                for k, v in _stats.items() if v[0])
+
+
+@contextlib.contextmanager
+def collect_stats(reset=True):
+    """Context manager that enables instrumentation within its block.
+
+    Parameters
+    ----------
+    reset : bool
+        If True, which is the default, then the statistics are reset at
+        the start of the block.
+
+    Instrumentation is disabled at the end of the block, unless it was
+    already enabled at the start. Use `stats` to get the results.
+    """
+    if reset:
+        reset_stats()
+    enabled = stats_enabled()
+    enable_stats()
+    try:
+        yield
+    finally:
+        if not enabled:
+            disable_stats()
+
+
+if os.environ.get("ANGLES_STATS", "0") not in ("", "0"):
+    enable_stats()
@@ -0,0 +1,257 @@
+"""Benchmarks for angles.
+
+Run as
+
+    python bench_angles.py [-o results.json] [--compare old.json]
+
+Each benchmark is timed with timeit, and the best time per call is
+printed, along with the number of calls per second. The time taken by
+"import angles" in a new interpreter, over that taken by the interpreter
+itself, is also printed; this includes compiling the module if bytecode
+files are not written.
+
+With -o the results are also written to a JSON file. Files from
+different versions of angles, or different machines, can be compared
+with --compare, which prints the ratio of the times.
+
+Benchmarks for functions that are not available, for example array
+functions when NumPy is not installed, are skipped.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SETUP = """
+import itertools
+from angles import *
+c = itertools.count()
+p = AngularPosition(alpha=12.5, delta=-30.25)
+p2 = AngularPosition(alpha=13.5, delta=-29.25)
+a = Angle(sg="12h34m16.592849219")
+alpha = AlphaAngle(h=12.54678345)
+delta = DeltaAngle(d=-30.2512345)
+try:
+    ref = ReferencePoint(0.1, 0.2)
+    v1, v2 = unit_vector(0.1, 0.2), unit_vector(0.3, 0.4)
+    fc = FormatCache()
+    fa, fb = FixedAngle(d=12.5), FixedAngle(d=-30.25)
+    cv1 = CartesianVector.from_spherical(1.0, 0.1, 0.2)
+    cv2 = CartesianVector.from_spherical(1.0, 0.3, 0.4)
+except NameError:  # Older versions.
+    pass
+"""
+
+ARRAY_SETUP = """
+import itertools
+from angles import *
+c = itertools.count()
+import numpy as np
+rng = np.random.RandomState(0)
+x = rng.uniform(-720, 720, 100000)
+ra = rng.uniform(0, 2 * np.pi, 100000)
+dec = np.arcsin(rng.uniform(-1, 1, 100000))
+cat = AngularPositionArray(np.degrees(ra), np.degrees(dec))
+cat2 = AngularPositionArray(np.degrees(ra[::-1]), np.degrees(dec[::-1]))
+s = ["12h13m12.4s", "-12:13:12.4", "14.56ss", "12d 14m"] * 2500
+lines = ["12 22 54.899 +15 49 20.57"] * 10000
+p = AngularPosition(alpha=12.5, delta=-30.25)
+try:
+    pix = ang2pix(ra, dec, 1024)
+    parts = deci2sexa_array(x)
+    sg, hd, mm, ss = [parts[i] for i in ("sign", "hd", "mm", "ss")]
+except NameError:  # Older versions.
+    pass
+"""
+
+KDTREE_SETUP = ARRAY_SETUP + """
+tree = AngularKDTree(cat)
+"""
+
+# (name, statement, setup, calls per statement).
+BENCHMARKS = [
+    ("r2d", "r2d(1.2345)", SETUP, 1),
+    ("d2r", "d2r(123.45)", SETUP, 1),
+    ("h2d", "h2d(12.345)", SETUP, 1),
+    ("d2h", "d2h(123.45)", SETUP, 1),
+    ("arcs2d", "arcs2d(1234.5)", SETUP, 1),
+    ("d2arcs", "d2arcs(123.45)", SETUP, 1),
+    ("h2r", "h2r(12.345)", SETUP, 1),
+    ("r2h", "r2h(1.2345)", SETUP, 1),
+    ("arcs2r", "arcs2r(1234.5)", SETUP, 1),
+    ("r2arcs", "r2arcs(1.2345)", SETUP, 1),
+    ("arcs2h", "arcs2h(1234.5)", SETUP, 1),
+    ("h2arcs", "h2arcs(12.345)", SETUP, 1),
+    ("d2d", "d2d(123.45)", SETUP, 1),
+    ("h2h", "h2h(12.345)", SETUP, 1),
+    ("r2r", "r2r(1.2345)", SETUP, 1),
+    ("normalize", "normalize(-370.5, 0, 360)", SETUP, 1),
+    ("normalize b=True", "normalize(100.5, -90, 90, b=True)", SETUP, 1),
+    ("deci2sexa", "deci2sexa(-12.348978659, pre=5)", SETUP, 1),
+    ("deci2sexa exact", "deci2sexa(-12.348978659, pre=5, exact=True)", SETUP, 1),
+    ("sexa2deci", "sexa2deci(-1, 12, 20, 56.32317)", SETUP, 1),
+    ("fmt_angle", "fmt_angle(12.348978659, pre=5)", SETUP, 1),
+    ("FormatCache.fmt_angle hit", "fc.fmt_angle(12.348978659, pre=5)", SETUP, 1),
+    ("phmsdms", "phmsdms('-12d13m14.56s')", SETUP, 1),
+    ("pposition", "pposition('12 22 54.899 +15 49 20.57')", SETUP, 1),
+    ("sep", "sep(0.1, 0.2, 0.3, 0.4)", SETUP, 1),
+    ("bear", "bear(0.1, 0.2, 0.3, 0.4)", SETUP, 1),
+    ("sep_vec", "sep_vec(v1, v2)", SETUP, 1),
+    ("bear_vec", "bear_vec(v1, v2)", SETUP, 1),
+    ("ReferencePoint.sep_to", "ref.sep_to(0.3, 0.4)", SETUP, 1),
+    ("ReferencePoint.bear_to", "ref.bear_to(0.3, 0.4)", SETUP, 1),
+    ("normalize_sphere", "normalize_sphere(180, 91)", SETUP, 1),
+    ("Angle()", "Angle(d=123.45)", SETUP, 1),
+    ("Angle(sg)", "Angle(sg='12h34m16.592849219')", SETUP, 1),
+    ("AlphaAngle()", "AlphaAngle(h=12.345)", SETUP, 1),
+    ("DeltaAngle()", "DeltaAngle(d=-30.25)", SETUP, 1),
+    ("Angle + Angle", "a + a", SETUP, 1),
+    ("Angle - Angle", "a - a", SETUP, 1),
+    ("FixedAngle()", "FixedAngle(d=123.45)", SETUP, 1),
+    ("FixedAngle + FixedAngle", "fa + fb", SETUP, 1),
+    ("FixedAngle < FixedAngle", "fa < fb", SETUP, 1),
+    ("AngularPosition()", "AngularPosition(alpha=12.5, delta=-30.25)", SETUP, 1),
+    ("AngularPosition.from_hd",
+     "AngularPosition.from_hd('12 22 54.899 +15 49 20.57')", SETUP, 1),
+    # The value is changed every time, so that the remembered strings
+    # are not reused.
+    ("str(Angle)", "a.d = next(c) * 1e-3; str(a)", SETUP, 1),
+    ("str(AlphaAngle)", "alpha.h = next(c) * 1e-4; str(alpha)", SETUP, 1),
+    ("str(DeltaAngle)", "delta.d = next(c) * 1e-6; str(delta)", SETUP, 1),
+    ("str(AngularPosition)", "p.alpha.h = next(c) * 1e-4; str(p)", SETUP, 1),
+    ("str(AngularPosition) unchanged", "str(p)", SETUP, 1),
+    ("AngularPosition alpha.d", "p.alpha.d", SETUP, 1),
+    ("AngularPosition alpha.d, delta.d", "p.alpha.d; p.delta.d", SETUP, 1),
+    ("AngularPosition set delta.d", "p.delta.d = -30.25", SETUP, 1),
+    ("AngularPosition.sep", "p.sep(p2)", SETUP, 1),
+    ("AngularPosition.bear", "p.bear(p2)", SETUP, 1),
+    ("AlphaAngle hms sign, hh, mm, ss",
+     "h = alpha.hms; h.sign; h.hh; h.mm; h.ss", SETUP, 1),
+    ("CartesianVector.from_spherical",
+     "CartesianVector.from_spherical(1.0, 0.1, 0.2)", SETUP, 1),
+    ("CartesianVector.dot", "cv1.dot(cv2)", SETUP, 1),
+    ("CartesianVector.cross", "cv1.cross(cv2)", SETUP, 1),
+    ("CartesianVector.normalized_angles", "cv1.normalized_angles", SETUP, 1),
+    # Array functions; times are per element.
+    ("normalize_array", "normalize_array(x)", ARRAY_SETUP, 100000),
+    ("deci2sexa_array", "deci2sexa_array(x)", ARRAY_SETUP, 100000),
+    ("deci2sexa_array exact", "deci2sexa_array(x, exact=True)", ARRAY_SETUP, 100000),
+    ("sexa2deci_array", "sexa2deci_array(sg, hd, mm, ss)", ARRAY_SETUP, 100000),
+    ("fmt_angle_array", "fmt_angle_array(x)", ARRAY_SETUP, 100000),
+    ("parse_many", "parse_many(s)", ARRAY_SETUP, 10000),
+    ("pposition_chunks", "list(pposition_chunks(lines))", ARRAY_SETUP, 10000),
+    ("sep_array", "sep_array(ra, dec, ra[::-1], dec[::-1])", ARRAY_SETUP, 100000),
+    ("bear_array", "bear_array(ra, dec, ra[::-1], dec[::-1])", ARRAY_SETUP, 100000),
+    ("AngularPositionArray.sep", "cat.sep(cat2)", ARRAY_SETUP, 100000),
+    ("ang2pix", "ang2pix(ra, dec, 1024)", ARRAY_SETUP, 100000),
+    ("pix2ang", "pix2ang(pix, 1024)", ARRAY_SETUP, 100000),
+    ("cone_pixels", "cone_pixels(1.0, 0.5, 0.05, 1024)", ARRAY_SETUP, 1),
+    ("sep_matrix 1e3 x 1e3", "sep_matrix(cat[:1000], cat2[:1000])",
+     ARRAY_SETUP, 1000000),
+    ("AngularKDTree()", "AngularKDTree(cat)", ARRAY_SETUP, 100000),
+    ("AngularKDTree.query_radius", "tree.query_radius(p, 0.02)",
+     KDTREE_SETUP, 1),
+    ("AngularKDTree.query", "tree.query(p, k=10)", KDTREE_SETUP, 1),
+    ("crossmatch 1e5 x 1e5", "crossmatch(cat, cat2, 1e-4)", ARRAY_SETUP, 100000),
+]
+
+
+def _expand_import(setup):
+    # timeit runs the setup inside a function, where "from angles
+    # import *" is not allowed in Python 3; import the public names of
+    # the angles being benchmarked one by one instead.
+    import angles
+    names = [i for i in dir(angles) if not i.startswith("_")]
+    return setup.replace("from angles import *",
+                         "from angles import " + ", ".join(names))
+
+
+def run(stmt, setup=SETUP, number=10000, repeat=5):
+    """Best time per execution of stmt, in microseconds."""
+    t = timeit.repeat(stmt, setup=_expand_import(setup), number=number,
+                      repeat=repeat)
+    return min(t) / number * 1e6
+
+
+def autorange(stmt, setup=SETUP, repeat=5, min_time=0.2):
+    """Like run, with the number of loops chosen to take about min_time."""
+    number = 1
+    while number < 10 ** 7:
+        t = run(stmt, setup=setup, number=number, repeat=1) * number / 1e6
+        if t >= min_time:
+            break
+        number *= 10 if t < min_time / 10 else 2
+    return run(stmt, setup=setup, number=number, repeat=repeat)
+
+
+def import_time(repeat=10):
+    """Best time, in milliseconds, for "import angles" in a new process."""
+    def best(code):
+        t = []
+        for i in range(repeat):
+            t0 = time.time()
+            subprocess.check_call([sys.executable, "-c", code], cwd=HERE)
+            t.append(time.time() - t0)
+        return min(t)
+    return (best("import angles") - best("pass")) * 1e3
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for angles.")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run")
+    parser.add_argument("-k", dest="select", default="",
+                        help="run only benchmarks with this in their names")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of timing runs; the best is used")
+    args = parser.parse_args(args)
+
+    sys.path.insert(0, HERE)
+    import angles
+
+    old = {}
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)["results"]
+
+    results = {}
+    for name, stmt, setup, n in BENCHMARKS:
+        if args.select not in name:
+            continue
+        try:
+            us = autorange(stmt, setup, args.repeat) / n
+        except Exception as e:
+            print("{0:40s} skipped: {1}".format(name, e))
+            continue
+        results[name] = {"us_per_call": us, "calls_per_sec": 1e6 / us}
+        line = "{0:40s} {1:12.4f} us {2:14.0f} /s".format(name, us, 1e6 / us)
+        if name in old:
+            line += "  {0:6.2f}x".format(us / old[name]["us_per_call"])
+        print(line)
+
+    if args.select in "import angles":
+        ms = import_time()
+        results["import angles"] = {"ms": ms}
+        line = "{0:40s} {1:12.4f} ms".format("import angles", ms)
+        if "import angles" in old:
+            line += "  {0:6.2f}x".format(ms / old["import angles"]["ms"])
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"angles_version": angles.__version__,
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
 import math
+import os
 import pytest
 from angles import (
     r2d, d2r, h2d, d2h, r2h, h2r, arcs2r, arcs2h, h2arcs, d2arcs, arcs2d,
-    normalize, deci2sexa, sexa2deci, fmt_angle, phmsdms, pposition, sep, bear,
+    normalize, normalize_array, deci2sexa, deci2sexa_array, sexa2deci,
+    sexa2deci_array, fmt_angle, fmt_angle_array, phmsdms, parse_many, pposition,
+    pposition_chunks, sep, sep_array, bear,
+    bear_array,
     Angle, AlphaAngle, DeltaAngle, CartesianVector, normalize_sphere,
-    AngularPosition
+    AngularPosition, AngularPositionArray, AngularKDTree, nside2npix, ang2pix,
+    pix2ang, cone_pixels, crossmatch, sep_matrix, ReferencePoint, unit_vector,
+    sep_vec, bear_vec, FormatCache, FixedAngle
 )
 
 
@@ -104,6 +110,32 @@ def test_normalize_b_true_outside_left_limit():
     assert normalize(-361, L, U, b=True) == -1
 
 
+def test_normalize_array_must_match_normalize():
+    """Array normalization must give exactly the same values as normalize."""
+    np = pytest.importorskip("numpy")
+    x = [-721, -361, -360, -270, -181, -180, -100, -91, -90, -1, 0, 1, 10,
+         89, 90, 91, 100, 180, 181, 270, 271, 361, 368.5, 721, 36000 + 180.0]
+
+    for L, U, b in [(0, 360, False), (-90, 90, False), (-180, 180, False),
+                    (0, 24, False), (-90, 90, True), (-180, 180, True),
+                    (-math.pi, math.pi, False), (0, 2 * math.pi, False),
+                    (-math.pi / 2, math.pi / 2, True)]:
+        r = normalize_array(x, L, U, b=b)
+        assert r.dtype == np.float64
+        assert r.tolist() == [normalize(i, L, U, b=b) for i in x]
+
+    x = [int(i) for i in x]
+    out = np.empty(len(x))
+    r = normalize_array(np.array(x, dtype=np.int32), -90, 90, b=True, out=out)
+    assert r is out
+    assert out.tolist() == [normalize(i, -90, 90, b=True) for i in x]
+
+    with pytest.raises(ValueError):
+        normalize_array(x, 0, 360, b=True)
+    with pytest.raises(ValueError):
+        normalize_array(x, 1, 90)
+
+
 def test_deci2sexa_pre_should_work_as_expected():
     """The pre keyword should round decimal places to required values."""
     assert deci2sexa(-11.2345678) == (-1, 11, 14, 4.444)
@@ -148,6 +180,147 @@ def test_deci2sexa_upper_trim_should_trim_upper_limit():
     assert deci2sexa(x, lower=0, upper=24, pre=5, upper_trim=True) == (1, 23, 59, 59.99999)
 
 
+def test_deci2sexa_array_must_match_deci2sexa():
+    """Array conversion must give exactly the same values as deci2sexa."""
+    np = pytest.importorskip("numpy")
+    import random
+    random.seed(12345)
+    x = 23+59/60.0+59.99999/3600.0
+    values = [0, 24, -24, x, -x, 1.9999, -11.2345678, 12.348978659, 89.99999999,
+              -0.0000001, 359.9999999, 360, -91, 91]
+    values += [random.uniform(-400, 400) for i in range(500)]
+
+    for pre in (-1, 0, 1, 3, 5):
+        for trunc in (False, True):
+            for lower, upper, b, upper_trim in [
+                    (None, None, False, False), (None, None, False, True),
+                    (0, 24, False, True), (0, 360, False, False),
+                    (-90, 90, True, False), (-90, 90, False, False)]:
+                s = deci2sexa_array(values, pre=pre, trunc=trunc,
+                                    lower=lower, upper=upper, b=b,
+                                    upper_trim=upper_trim)
+                assert s.shape == (len(values),)
+                r = [deci2sexa(i, pre=pre, trunc=trunc, lower=lower,
+                               upper=upper, b=b, upper_trim=upper_trim)
+                     for i in values]
+                assert [tuple(i) for i in s.tolist()] == r
+
+    s = deci2sexa_array(np.array([[x, -x], [24, 0]]), lower=0, upper=24, upper_trim=True)
+    assert s.shape == (2, 2)
+    assert s[0, 0].tolist() == (1, 0, 0, 0.0)
+
+    for v in (float("nan"), float("inf"), -float("inf"), 1e19, -2.0 ** 62):
+        with pytest.raises(ValueError):
+            deci2sexa_array([1.0, v])
+    # Large values are fine once normalized.
+    assert deci2sexa_array([1e19], lower=0, upper=360)[0].tolist() == \
+        deci2sexa(1e19, lower=0, upper=360)
+
+
+def _exact_units(d, pre, trunc):
+    # Number of 10**-pre seconds in abs(d), from the exact value of d.
+    from fractions import Fraction
+    q = Fraction(abs(d)) * 3600 * 10 ** pre
+    return math.floor(q) if trunc else round(q)
+
+
+def test_deci2sexa_exact_sweep():
+    """exact=True must be correct, and differ from the default only at
+    values where the default is off by one in the last place."""
+    import random
+    random.seed(12345)
+    values = [0.0, 24.0, -0.0000001, 359.9999999, 23+59/60.0+59.99999/3600.0]
+    values += [random.uniform(-400, 400) for i in range(200)]
+    # Numbers that are on, or a few ulp away from, a rounding boundary,
+    # for example x.4999999 or x.9999999 seconds.
+    for i in range(2000):
+        pre = random.randint(0, 9)
+        n = random.randint(0, 360 * 3600 * 10 ** pre) + random.choice((0, 0.5))
+        d = n / (3600.0 * 10 ** pre) * (1 + random.randint(-4, 4) * 2.0 ** -53)
+        values.append(random.choice((-1, 1)) * d)
+
+    fixed = 0
+    for pre in range(10):
+        fp = 10 ** pre
+        for trunc in (False, True):
+            for d in values:
+                e = deci2sexa(d, pre=pre, trunc=trunc, exact=True)
+                n = _exact_units(d, pre, trunc)
+                assert (e[1] * 3600 + e[2] * 60) * fp + round(e[3] * fp) == n
+                assert 0 <= e[2] < 60 and 0 <= e[3] < 60
+                assert e[0] == (-1 if d < 0 and n else 1)
+                f = deci2sexa(d, pre=pre, trunc=trunc)
+                if f != e:
+                    m = (f[1] * 3600 + f[2] * 60) * fp + round(f[3] * fp)
+                    assert abs(m - n) == 1
+                    fixed += 1
+    assert fixed > 0
+
+    # Exact ties are rounded to even, and results are ints, also on
+    # Python 2.
+    import angles
+    r = [angles._scale_int(v, 1) for v in (0.5, 1.5, 2.5, 3.5)]
+    assert r == [0, 2, 2, 4] and all(type(i) is int for i in r)
+    assert angles._scale_int(2.5, 1, trunc=True) == 2
+
+    assert deci2sexa(0.33013888888888887, pre=0) == (1, 0, 19, 49.0)
+    assert deci2sexa(0.33013888888888887, pre=0, exact=True) == (1, 0, 19, 48.0)
+    assert fmt_angle(3.4739722222222222, pre=1, trunc=True, exact=True) == \
+        '+03 28 26.3'
+
+    # Negative pre is not affected.
+    for d in values[:200]:
+        for trunc in (False, True):
+            assert (deci2sexa(d, pre=-1, trunc=trunc, exact=True) ==
+                    deci2sexa(d, pre=-1, trunc=trunc))
+
+    # The normalization and upper_trim work as usual.
+    x = 23+59/60.0+59.99999/3600.0
+    assert deci2sexa(x, exact=True) == (1, 24, 0, 0.0)
+    assert deci2sexa(-x, lower=0, upper=24, upper_trim=True, exact=True) == \
+        (1, 0, 0, 0.0)
+
+    np = pytest.importorskip("numpy")
+    for pre in (0, 3, 6, 9, 13):
+        for trunc in (False, True):
+            for kw in [dict(), dict(lower=0, upper=24, upper_trim=True)]:
+                s = deci2sexa_array(values, pre=pre, trunc=trunc, exact=True,
+                                    **kw)
+                assert [tuple(i) for i in s.tolist()] == [
+                    deci2sexa(i, pre=pre, trunc=trunc, exact=True, **kw)
+                    for i in values]
+                s = fmt_angle_array(values, pre=pre, trunc=trunc, exact=True,
+                                    **kw)
+                assert s == [fmt_angle(i, pre=pre, trunc=trunc, exact=True, **kw)
+                             for i in values]
+    # Values with few decimals, or whole arcseconds, lie exactly on, or
+    # next to, a boundary; they must not need rational arithmetic.
+    import fractions
+    rng = np.random.RandomState(1)
+    x = np.concatenate([np.round(rng.uniform(-360, 360, 1000), 3),
+                        np.round(rng.uniform(-360, 360, 1000) * 3600) / 3600])
+    expected = [deci2sexa(i, pre=3, trunc=True, exact=True)
+                for i in x.tolist()]
+    original = fractions.Fraction
+    fractions.Fraction = None
+    try:
+        for trunc in (False, True):
+            fmt_angle_array(x, pre=3, trunc=trunc, exact=True)
+            [deci2sexa(i, pre=3, trunc=trunc, exact=True) for i in x.tolist()]
+    finally:
+        fractions.Fraction = original
+    s = deci2sexa_array(x, pre=3, trunc=True, exact=True)
+    assert [tuple(i) for i in s.tolist()] == expected
+    for i, j in zip(x.tolist(), expected):
+        units = ((j[1] * 3600 + j[2] * 60) * 1000 + round(j[3] * 1000))
+        assert units == _exact_units(i, 3, True)
+
+    # Values too large for a float count of units.
+    s = deci2sexa_array([1e13, -2.5e12], pre=3, exact=True)
+    assert [tuple(i) for i in s.tolist()] == [
+        deci2sexa(1e13, pre=3, exact=True), deci2sexa(-2.5e12, pre=3, exact=True)]
+
+
 def test_sexa2deci():
     assert sexa2deci(1, 1, 0, 0) == 1
     assert sexa2deci(-1, 1, 0, 0) == -1
@@ -156,6 +329,25 @@ def test_sexa2deci():
     assert sexa2deci(-1, 23, 59, 59.99999) == -1 * (23+59/60.0+59.99999/3600.0)
 
 
+def test_sexa2deci_array_must_match_sexa2deci():
+    np = pytest.importorskip("numpy")
+    import random
+    random.seed(12345)
+    rows = [(random.choice((-1, 1)), random.randint(0, 359),
+             random.randint(0, 59), random.uniform(0, 60)) for i in range(500)]
+    rows += [(1, 23, 59, 59.99999), (-1, 23, 59, 59.99999), (1, 0, 0, 0), (-1, 0, 0, 0.0)]
+    sign, hd, mm, ss = [np.array(i) for i in zip(*rows)]
+
+    for todeg in (False, True):
+        d = sexa2deci_array(sign, hd, mm, ss, todeg=todeg)
+        assert d.tolist() == [sexa2deci(*(i + (todeg,))) for i in rows]
+
+    sign[[3, 7]] = [0, 2]
+    d = sexa2deci_array(sign, hd, mm, ss)
+    assert np.isnan(d).nonzero()[0].tolist() == [3, 7]
+    assert d[0] == sexa2deci(*rows[0])
+
+
 def test_fmt_angle():
     assert fmt_angle(1.9999, pre=3, trunc=True) == '+01 59 59.639'
     assert fmt_angle(1.9999, pre=0, trunc=True) == '+01 59 59'
@@ -172,6 +364,47 @@ def test_fmt_angle():
     assert fmt_angle(-x) == '-24 00 00.000'
 
 
+def test_fmt_angle_array_must_match_fmt_angle():
+    np = pytest.importorskip("numpy")
+    import random
+    random.seed(12345)
+    x = 23+59/60.0+59.99999/3600.0
+    values = [0, 24, -24, x, -x, 1.9999, -11.2345678, 12.348978659, 89.99999999,
+              -0.0000001, 359.9999999, 360, -91, 91, 1234.5, -98765.4321]
+    values += [random.uniform(-400, 400) for i in range(300)]
+
+    for pre in (0, 1, 3, 5, 9, 13):
+        for trunc in (False, True):
+            for kw in [dict(), dict(s1="HH ", s2="MM ", s3="SS"),
+                       dict(s1=u"\u00b0", s2="'", s3='"'),
+                       dict(lower=0, upper=24, upper_trim=True),
+                       dict(lower=-90, upper=90, b=True)]:
+                s = fmt_angle_array(values, pre=pre, trunc=trunc, **kw)
+                assert s == [fmt_angle(i, pre=pre, trunc=trunc, **kw)
+                             for i in values]
+
+    s = fmt_angle_array(np.array([[x, -x]]), lower=0, upper=24, upper_trim=True,
+                        as_bytes=True)
+    assert s.dtype.kind == "S"
+    assert s.tolist() == [b"+00 00 00.000", b"+00 00 00.000"]
+    assert fmt_angle_array([]) == []
+
+    with pytest.raises(ValueError):
+        fmt_angle_array(values, pre=-1)
+
+    # Bad values raise ValueError, like fmt_angle, instead of giving
+    # garbage strings.
+    for v in (float("nan"), float("inf")):
+        for pre in (3, 13):
+            with pytest.raises(ValueError):
+                fmt_angle_array([1.0, v], pre=pre)
+        with pytest.raises(ValueError):
+            fmt_angle(v)
+    with pytest.raises(ValueError):
+        fmt_angle_array([1e19])
+    assert fmt_angle_array([1e19], pre=13) == [fmt_angle(1e19, pre=13)]
+
+
 def test_phmsdms():
     """Parse reasonably formatted hms dms strings."""
     assert phmsdms("12") == {'parts': [12.0, None, None],
@@ -236,11 +469,68 @@ def test_phmsdms():
         phmsdms("-12:-13:12.4s")
 
 
+def test_parse_many():
+    strings = ["12", "12h", "12d13m14.56", "12d14.56ss", "14.56ss", "12h13m12.4s",
+               "12:13:12.4s", "-12:13:12.4s", "-13m12s", "-12s", "1 2 3 4"]
+    expected = [phmsdms(i) for i in strings]
+
+    r = list(parse_many(iter(strings), lazy=True))
+    assert r == [(i['sign'], i['vals'], i['units']) for i in expected]
+
+    with pytest.raises(ValueError):
+        list(parse_many(["12", "12:13mm:12.4s"], lazy=True))
+
+    pytest.importorskip("numpy")
+    r = parse_many(strings)
+    assert r['sign'].tolist() == [i['sign'] for i in expected]
+    assert r['vals'].tolist() == [i['vals'] for i in expected]
+    assert r['units'].tolist() == [i['units'] for i in expected]
+    assert parse_many([])['vals'].shape == (0, 3)
+
+
 def test_pposition():
     ra, de = pposition("12 22 54.899 +15 49 20.57")
     assert ra == 12+(22/60.0)+(54.899/3600.0)
     assert de == 15+(49/60.0)+(20.57/3600.0)
 
+    # Numbers without digits before the decimal point are parsed as in
+    # phmsdms().
+    r = pposition("12 30 .5 +15 00 00", details=True)
+    assert r['raw_x'] == phmsdms("12 30 .5")
+    assert r['x'] == pposition("12 30 .5 +15 00 00")[0]
+
+
+def test_pposition_details():
+    r = pposition("12 22 54.899 -15 49 20.57", details=True)
+    assert r['numvals'] == 6
+    assert r['raw_x'] == phmsdms("12 22 54.899")
+    assert r['raw_y'] == phmsdms("-15 49 20.57")
+    assert r['y'] == -(15+(49/60.0)+(20.57/3600.0))
+
+    with pytest.raises(ValueError):
+        pposition("12 22 54.899 +15 49")
+
+
+def test_pposition_chunks():
+    pytest.importorskip("numpy")
+    import io
+    lines = ["19 16 35.57 +30 11 00.5", "19d 16 35.57 +30 11 00.5",
+             "12.5 -45.0", "", "  1 2 3 -4 5 6  "] * 3
+    f = io.StringIO(u"\n".join(lines))
+    chunks = list(pposition_chunks(f, chunksize=5))
+    assert [len(a) for a, d in chunks] == [5, 5, 2]
+
+    positions = [AngularPosition.from_hd(i.strip()) for i in lines if i]
+    alpha = [i for a, d in chunks for i in a.tolist()]
+    delta = [i for a, d in chunks for i in d.tolist()]
+    assert [round(i, 12) for i in alpha] == [round(p.alpha.d, 12) for p in positions]
+    assert [round(i, 12) for i in delta] == [round(p.delta.d, 12) for p in positions]
+
+    with pytest.raises(ValueError):
+        list(pposition_chunks(["1 2", "1 2 3"]))
+    r = list(pposition_chunks(["1 2", "1 2 3"], skip_invalid=True))
+    assert len(r) == 1 and r[0][0].tolist() == [15.0]
+
 
 def test_sep_against_slalib_dsep():
     """Results from sep should match those from slalib.dsep"""
@@ -367,6 +657,38 @@ def test_sep_against_slalib_dsep():
     assert abs(max(d)) <= 1e-8
 
 
+def test_sep_array_must_match_sep():
+    np = pytest.importorskip("numpy")
+    import random
+    random.seed(12345)
+    alpha = [random.uniform(0, 2 * math.pi) for i in range(100)]
+    delta = [random.uniform(-math.pi / 2, math.pi / 2) for i in range(100)]
+    alpha1 = [random.uniform(0, 2 * math.pi) for i in range(100)]
+    delta1 = [random.uniform(-math.pi / 2, math.pi / 2) for i in range(100)]
+
+    # Element-wise; sep itself agrees with slalib.dsep.
+    s = sep_array(alpha, delta, alpha1, delta1)
+    s1 = [sep(*i) for i in zip(alpha, delta, alpha1, delta1)]
+    assert np.abs(s - s1).max() <= 1e-14
+
+    # One-to-many and many-to-one.
+    s = sep_array(alpha[0], delta[0], alpha1, delta1)
+    assert s.shape == (100,)
+    assert np.abs(s - [sep(alpha[0], delta[0], a, b)
+                       for a, b in zip(alpha1, delta1)]).max() <= 1e-14
+    s = sep_array(alpha1, delta1, alpha[0], delta[0])
+    assert np.abs(s - [sep(a, b, alpha[0], delta[0])
+                       for a, b in zip(alpha1, delta1)]).max() <= 1e-14
+
+    # All pairs through broadcasting.
+    a, d = np.array(alpha[:10]), np.array(delta[:10])
+    s = sep_array(a[:, None], d[:, None], a[None, :], d[None, :])
+    assert s.shape == (10, 10)
+    assert (s.diagonal() == 0).all()
+
+    assert sep_array(0.0, -math.pi / 2, 0.0, math.pi / 2) == sep(0.0, -math.pi / 2, 0.0, math.pi / 2)
+
+
 def test_bear_against_slalib_dbear():
     # Random positions.
     import random
@@ -490,6 +812,37 @@ def test_bear_against_slalib_dbear():
     assert abs(max(d)) <= 1e-8
 
 
+def test_bear_array_must_match_bear():
+    np = pytest.importorskip("numpy")
+    import random
+    import warnings
+    random.seed(12345)
+    alpha = [random.uniform(0, 2 * math.pi) for i in range(100)]
+    delta = [random.uniform(-math.pi / 2, math.pi / 2) for i in range(100)]
+    alpha1 = [random.uniform(0, 2 * math.pi) for i in range(100)]
+    delta1 = [random.uniform(-math.pi / 2, math.pi / 2) for i in range(100)]
+
+    # bear itself agrees with slalib.dbear.
+    x, undefined = bear_array(alpha, delta, alpha1, delta1)
+    b = [bear(*i) for i in zip(alpha, delta, alpha1, delta1)]
+    assert np.abs(x - b).max() <= 1e-14
+    assert not undefined.any()
+
+    x, undefined = bear_array(alpha[0], delta[0], alpha1, delta1)
+    assert x.shape == undefined.shape == (100,)
+    assert np.abs(x - [bear(alpha[0], delta[0], a, d)
+                       for a, d in zip(alpha1, delta1)]).max() <= 1e-14
+
+    # Base points on the poles are flagged, without any warnings.
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        x, undefined = bear_array([0.0, 1.0, 2.0], [math.pi / 2, 0.0, -math.pi / 2],
+                                  0.5, 0.5)
+    assert undefined.tolist() == [True, False, True]
+    assert x[0] == x[2] == 0.0
+    assert x[1] == bear(1.0, 0.0, 0.5, 0.5)
+
+
 def test_angle_class_must_initialize_properly():
     a = Angle(sg="12h14m13.567s")
     val = 12 + 14/60.0 + 13.567 / 3600.0
@@ -662,6 +1015,219 @@ def test_angle_class_hms_and_dms_must_be_consistent():
     assert a.dms.dms == (1, 15, 0, 0.0)
 
 
+def test_angle_sexagesimal_parts_are_memoized(monkeypatch):
+    import angles
+    calls = []
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return deci2sexa(*args, **kwargs)
+
+    monkeypatch.setattr(angles, "deci2sexa", counting)
+    a = AlphaAngle(h=12.54678345)
+    x = (a.hms.sign, a.hms.hh, a.hms.mm, a.hms.ss)
+    assert x == (1, 12, 32, 48.42)
+    assert len(calls) == 1
+    a.dms.dd, a.dms.mm, a.dms.ss
+    assert len(calls) == 2
+
+    # Setters and formatting attributes invalidate the cached values.
+    a.hms.mm = 10
+    assert a.hms.hms == (1, 12, 10, 48.42)
+    a.pre = 1
+    assert a.hms.hms == (1, 12, 10, 48.4)
+    a.trunc = True
+    a.h = 1.0 / 3
+    assert a.hms.hms == (1, 0, 20, 0.0)
+
+    # String representations.
+    s = str(a)
+    assert s == "+00HH 20MM 00.0SS"
+    assert str(a) is s
+    a.s1 = ":"
+    assert str(a) == "+00:20MM 00.0SS"
+    h = a.hms
+    h.s1 = "h"
+    assert str(h) == "+00h20MM 00.0SS"
+
+    # Values shared with AngularPosition are updated when the other
+    # coordinate changes.
+    p = AngularPosition(alpha=165, delta=-89)
+    assert p.alpha.dms.dd == 165
+    p.delta.d = -91
+    assert p.alpha.dms.dd == 345
+    assert str(p.alpha) == "+23HH 00MM 00.000SS"
+
+
+def test_import_does_not_load_numpy():
+    import subprocess
+    import sys
+    code = ("import sys; import angles; "
+            "print(sorted(m for m in ('numpy', 'multiprocessing') if m in sys.modules))")
+    out = subprocess.check_output([sys.executable, "-c", code],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.decode().strip() == "[]"
+
+
+def test_array_functions_without_numpy(monkeypatch):
+    import sys
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    assert fmt_angle_array([12.348978659, -1.5]) == ['+12 20 56.323', '-01 30 00.000']
+    with pytest.raises(ImportError) as e:
+        fmt_angle_array([1.0], as_bytes=True)
+    assert "NumPy" in str(e.value)
+    with pytest.raises(ImportError):
+        normalize_array([1.0, 2.0])
+    with pytest.raises(ImportError):
+        AngularPositionArray([1.0], [2.0])
+    # Scalar API does not need NumPy.
+    assert list(parse_many(["12h"], lazy=True)) == [(1, [12.0, 0.0, 0.0], "hours")]
+    assert str(AngularPosition(alpha=10, delta=20)) == \
+        "+00HH 40MM 00.000SS +20DD 00MM 00.000SS"
+
+
+def test_stats():
+    import angles
+    import subprocess
+    import sys
+    original = angles.normalize
+    assert not angles.stats_enabled()
+    with angles.collect_stats():
+        assert angles.normalize is not original
+        p = AngularPosition(alpha=10, delta=20)
+        p.alpha.d, p.delta.d, p.alpha.d
+        str(p)
+        angles.sep(0.1, 0.2, 0.3, 0.4)
+    assert angles.normalize is original
+    assert not angles.stats_enabled()
+
+    s = angles.stats()
+    assert s["AngularPosition.__init__"]["calls"] == 1
+    assert s["Angle.__init__"]["calls"] == 2
+    assert s["sep"]["calls"] == 1
+    # Normalized angles are recalculated only when the vector changes.
+    assert s["CartesianVector.normalized_angles"]["calls"] == 3
+    assert s["AngularPosition._normalized_angles"]["calls"] > 3
+    for v in s.values():
+        assert sum(v["hist"]) == v["calls"] and v["time"] >= 0
+
+    # Not counted when disabled.
+    angles.sep(0.1, 0.2, 0.3, 0.4)
+    assert angles.stats()["sep"]["calls"] == 1
+    angles.reset_stats()
+    assert angles.stats() == {}
+
+    with angles.collect_stats():
+        with angles.collect_stats(reset=False):
+            angles.normalize(400.0)
+        assert angles.stats_enabled()
+        angles.normalize(400.0)
+    assert angles.stats()["normalize"]["calls"] == 2
+    angles.reset_stats()
+
+    # The parsing done by pposition and parse_many is counted.
+    with angles.collect_stats():
+        AngularPosition.from_hd("12 22 54.899 +15 49 20.57")
+        angles.pposition("12 22 54.899 +15 49 20.5.7")
+        angles.parse_many(["12h13m", "14d"])
+    s = angles.stats()
+    assert s["_psexa"]["calls"] == 4
+    assert s["phmsdms"]["calls"] == 3
+    angles.reset_stats()
+
+    env = dict(os.environ, ANGLES_STATS="1")
+    code = "import angles; angles.phmsdms('12h'); print(angles.stats()['phmsdms']['calls'])"
+    out = subprocess.check_output([sys.executable, "-c", code], env=env,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.decode().strip() == "1"
+
+
+def test_fixed_angle():
+    import random
+    from fractions import Fraction
+    random.seed(12345)
+
+    a = FixedAngle(d=12.5)
+    assert (a.n, a.d, a.h, a.arcs) == (45000000000000, 12.5, 12.5 / 15, 45000.0)
+    assert a.r == Angle(d=12.5).r
+    assert a.ounit == "degrees"
+    assert FixedAngle(h=-1).n == -54000000000000
+    assert FixedAngle(arcs=1e-9).n == 1
+    assert FixedAngle(n=7).n == 7 and FixedAngle(n=7).ounit == "degrees"
+    # n is always an exact int, and the getters do not use integer
+    # division, also on Python 2.
+    a = FixedAngle(d=1e6)
+    assert type(a.n) is int and a.n == 3600 * 10 ** 15
+    assert FixedAngle(n=1).d == 1 / 3.6e12 and FixedAngle(n=1).h == 1 / 5.4e13
+    assert FixedAngle(n=1).arcs == 1e-9
+    assert FixedAngle(sg="12h30m").n == FixedAngle(h=12.5).n
+    # Rounded from the exact value of the float, including values next
+    # to the middle of two nano-arcseconds.
+    for i in range(500):
+        k = random.randint(-360 * 3600 * 10 ** 9, 360 * 3600 * 10 ** 9)
+        d = random.choice([random.uniform(-400, 400),
+                           (k + 0.5) / (3600 * 10 ** 9)])
+        assert FixedAngle(d=d).n == round(Fraction(d) * 3600 * 10 ** 9)
+        assert FixedAngle(arcs=d).n == round(Fraction(d) * 10 ** 9)
+    with pytest.raises(TypeError):
+        FixedAngle(n=1, d=2)
+    with pytest.raises(ValueError):
+        FixedAngle(n=1.5)
+
+    # Same interface as Angle.
+    for d in [0, 1.9999, -11.2345678, 188.56913687174583, -359.9999999]:
+        a, b = FixedAngle(d=d), Angle(d=d)
+        assert a.dms.dms == b.dms.dms
+        assert a.hms.hms == b.hms.hms
+        assert str(a) == str(b)
+        a.ounit = b.ounit = "hours"
+        a.pre = b.pre = 5
+        assert str(a) == str(b)
+    a = FixedAngle(d=0)
+    a.hms.hms = (1, 1, 1, 1)
+    assert a.n == 54915 * 10 ** 9
+    a.dms.mm = 2
+    assert a.dms.dms == (1, 15, 2, 15.0)
+
+    # Exact arithmetic, comparisons and hashing.
+    x = FixedAngle(d=0.1)
+    s = FixedAngle(n=0)
+    for i in range(1000):
+        s = s + x
+    assert s == FixedAngle(d=100) and s.d == 100.0
+    assert (s - x).n == 999 * x.n
+    assert FixedAngle(d=1) != FixedAngle(d=2)
+    assert FixedAngle(d=1) < FixedAngle(d=2) <= FixedAngle(d=2)
+    assert FixedAngle(d=3) > FixedAngle(d=2) >= FixedAngle(d=2)
+    assert len({FixedAngle(d=1), FixedAngle(arcs=3600), FixedAngle(h=1)}) == 2
+    assert FixedAngle(d=1) != Angle(d=1)
+    with pytest.raises(TypeError):
+        FixedAngle(d=1) < Angle(d=2)
+    b = FixedAngle(d=1) + Angle(d=2)
+    assert type(b) is Angle and abs(b.d - 3) < 1e-12
+
+    # Wrapping is a modulo on n, like normalize.
+    for d in [0, 360, -360, 720.5, -0.5, 180, -180, 1e5 + 0.25]:
+        a = FixedAngle(d=d)
+        assert a.wrap().d == normalize(d, 0, 360)
+        assert a.wrap(-180, 180).d == normalize(d, -180, 180)
+    assert FixedAngle(n=-1).wrap().n == 360 * 3600 * 10 ** 9 - 1
+    with pytest.raises(ValueError):
+        FixedAngle(d=1).wrap(10, 10)
+
+    # No loss in the conversion to Angle and back, within [-360, 360].
+    for i in range(2000):
+        a = FixedAngle(n=random.randint(-360 * 3600 * 10 ** 9,
+                                        360 * 3600 * 10 ** 9))
+        b = a.to_angle()
+        assert type(b) is Angle and b.r == a.r
+        assert FixedAngle.from_angle(b) == a
+    a = AlphaAngle(h=12.54678345)
+    a.pre = 5
+    b = FixedAngle.from_angle(a)
+    assert (b.ounit, b.pre, b.hms.hms) == ("hours", 5, a.hms.hms)
+
+
 def test_alpha_angle():
     a = AlphaAngle(h=-12)
     assert a.h == 12
@@ -837,3 +1403,457 @@ def test_angular_position_bear():
     b = AngularPosition(45.0, -45.0)
 
     assert round(a.bear(b), 12) == round(d2r(180), 12)
+
+
+class _OneSlot(object):
+    __slots__ = ('a',)
+
+
+def _slot_names(obj):
+    return [name for cls in type(obj).__mro__
+            for name in getattr(cls, "__slots__", ())]
+
+
+def test_memory_per_object(record_property):
+    import sys
+    import struct
+    angle_slots = ['_cache', '_iunit', '_ounit', '_raw', 'pre', 's1', 's2',
+                   's3', 'trunc']
+    expected = [
+        (AlphaAngle(h=1.5), angle_slots),
+        (DeltaAngle(d=10.5), angle_slots),
+        (Angle(d=10.5), angle_slots),
+        (FixedAngle(d=10.5), sorted(angle_slots + ['_n'])),
+        (CartesianVector(1.0, 2.0, 3.0), ['x', 'y', 'z']),
+        (AngularPosition(10.5, 20.5),
+         ['_alpha', '_delta', '_norm', '_vec', 'dlim']),
+        (Angle(d=1).hms, ['angle', 's1', 's2', 's3']),
+        (Angle(d=1).dms, ['angle', 's1', 's2', 's3']),
+    ]
+    # Each slot takes one pointer. The values themselves are shared,
+    # and hence not counted.
+    one = sys.getsizeof(_OneSlot())
+    pointer = struct.calcsize("P")
+    for i, slots in expected:
+        name = type(i).__name__
+        assert not hasattr(i, "__dict__"), name
+        assert sorted(_slot_names(i)) == slots, name
+        size = sys.getsizeof(i)
+        record_property("bytes " + name, size)
+        assert size == one + pointer * (len(slots) - 1), name
+
+    # The API is unchanged.
+    a = AlphaAngle(h=1.5)
+    a.pre = 1
+    a.s1, a.s2, a.s3 = ":", ":", ""
+    assert str(a) == "+01:30:00.0"
+    assert a.hms.hms == (1, 1, 30, 0.0)
+    assert a.ounit == "hours"
+    h = a.hms
+    h.s1 = "h"
+    assert h.s1 == "h"
+    p = AngularPosition(10.5, 20.5)
+    p.dlim = " | "
+    assert str(p) == "+00HH 42MM 00.000SS | +20DD 30MM 00.000SS"
+    with pytest.raises(AttributeError):
+        p.alpha.foo = 1
+
+
+def test_angular_position_array():
+    np = pytest.importorskip("numpy")
+    import random
+    random.seed(12345)
+    alpha = [random.uniform(-400, 400) for i in range(50)] + [165, 0, 375, -375]
+    delta = [random.uniform(-200, 200) for i in range(50)] + [-91, 91, 45, -91]
+    positions = [AngularPosition(a, d) for a, d in zip(alpha, delta)]
+
+    pa = AngularPositionArray(alpha, delta)
+    assert len(pa) == len(positions)
+    assert pa.xyz.shape == (len(positions), 3)
+    for unit in ("r", "d", "h", "arcs"):
+        assert np.abs(getattr(pa.alpha, unit) -
+                      [getattr(p.alpha, unit) for p in positions]).max() < 1e-8
+        assert np.abs(getattr(pa.delta, unit) -
+                      [getattr(p.delta, unit) for p in positions]).max() < 1e-8
+
+    # Slices share memory; integer indices give AngularPosition.
+    s = pa[10:20]
+    assert isinstance(s, AngularPositionArray) and len(s) == 10
+    assert np.shares_memory(s.xyz, pa.xyz)
+    p = pa[-1]
+    assert isinstance(p, AngularPosition)
+    assert str(p) == str(positions[-1])
+    assert len(list(pa)) == len(pa)
+    assert len(pa[pa.delta.d > 0]) == sum(1 for i in positions if i.delta.d > 0)
+
+    # Conversion to and from lists of AngularPosition.
+    pb = AngularPositionArray.from_positions(positions)
+    assert np.abs(pb.xyz - pa.xyz).max() < 1e-14
+    assert [str(i) for i in pa.to_positions()] == [str(i) for i in positions]
+    assert len(AngularPositionArray.from_positions([])) == 0
+
+    # Separation and bearing, to one point and element-wise.
+    q = positions[0]
+    assert np.abs(pa.sep(q) - [i.sep(q) for i in positions]).max() < 1e-12
+    x, undefined = pa.bear(q)
+    assert not undefined.any()
+    # Bearing of q from itself is not meaningful.
+    assert np.abs(x[1:] - [i.bear(q) for i in positions[1:]]).max() < 1e-10
+    r = pa.sep(pa[::-1])
+    assert np.abs(r - [i.sep(j) for i, j in zip(positions, positions[::-1])]).max() < 1e-12
+
+    with pytest.raises(ValueError):
+        AngularPositionArray.from_vectors(np.zeros((3, 2)))
+
+
+def test_angular_position_array_angles_computed_once(monkeypatch):
+    np = pytest.importorskip("numpy")
+    import angles
+    calls = []
+
+    def counting_normalize_array(*args, **kwargs):
+        calls.append(1)
+        return normalize_array(*args, **kwargs)
+
+    monkeypatch.setattr(angles, "normalize_array", counting_normalize_array)
+    pa = AngularPositionArray([10, 20, 350], [-10, 45, 89])
+    a, d = pa.alpha.r, pa.delta.r
+    assert pa.alpha.r is a and pa.delta.r is d
+    assert len(calls) == 2
+    with pytest.raises(ValueError):
+        a[0] = 1.0
+    b = AngularPositionArray.from_vectors(pa.xyz)
+    assert b.delta.r.tolist() == d.tolist()
+    assert len(calls) == 4
+
+
+def _random_positions(n, seed):
+    import random
+    random.seed(seed)
+    alpha = [random.uniform(0, 360) for i in range(n)]
+    delta = [math.degrees(math.asin(random.uniform(-1, 1))) for i in range(n)]
+    return AngularPositionArray(alpha, delta)
+
+
+def test_angular_kd_tree_against_brute_force():
+    np = pytest.importorskip("numpy")
+    cat = _random_positions(2000, 12345)
+    # Duplicates and poles.
+    cat = AngularPositionArray.from_vectors(np.concatenate(
+        [cat.xyz, cat.xyz[:5], AngularPositionArray([0, 0], [90, -90]).xyz]))
+    queries = _random_positions(30, 54321)
+    tree = AngularKDTree(cat, leafsize=8)
+
+    for r in (0.0, 1e-3, 0.05, 0.3, 2.0, math.pi):
+        result = tree.query_radius(queries, r)
+        assert len(result) == len(queries)
+        for q, (idx, s) in zip(queries, result):
+            s_all = cat.sep(q)
+            expected = np.nonzero(s_all <= r)[0]
+            assert sorted(idx.tolist()) == expected.tolist()
+            assert (s == s_all[idx]).all()
+            assert (np.diff(s) >= 0).all()
+
+    # A radius that exactly equals a separation from AngularPosition.sep
+    # includes that point, and the selection agrees with
+    # AngularPosition.sep for all points.
+    q = queries[0]
+    s_all = np.array([q.sep(p) for p in cat])
+    for k in range(0, 2000, 50):
+        r = q.sep(cat[k])
+        idx, s = tree.query_radius(q, r)
+        assert sorted(idx.tolist()) == np.nonzero(s_all <= r)[0].tolist()
+        assert s[idx == k].tolist() == [r]
+    idx, s = tree.query_radius(queries[:1], q.sep(cat[7]))[0]
+    assert 7 in idx.tolist()
+
+    idx, s = tree.query(queries, k=5)
+    assert idx.shape == s.shape == (len(queries), 5)
+    for q, i, j in zip(queries, idx, s):
+        s_all = cat.sep(q)
+        order = np.lexsort((np.arange(len(s_all)), s_all))[:5]
+        assert i.tolist() == order.tolist()
+        assert (j == s_all[order]).all()
+
+    # Each duplicate is found.
+    idx, s = tree.query(cat[0], k=2)
+    assert sorted(idx.tolist()) == [0, 2000] and s.tolist() == [0.0, 0.0]
+
+    small = AngularKDTree(cat[:3])
+    idx, s = small.query(q, k=10)
+    assert len(idx) == 3
+    empty = AngularKDTree(cat[:0])
+    assert len(empty.query_radius(q, 1.0)[0]) == 0
+    assert len(empty.query(q, k=2)[0]) == 0
+
+
+def test_healpix():
+    np = pytest.importorskip("numpy")
+    assert nside2npix(1) == 12
+    assert nside2npix(8) == 768
+    with pytest.raises(ValueError):
+        nside2npix(3)
+    with pytest.raises(ValueError):
+        pix2ang([768], 8)
+
+    # Centers of pixels map back to the same pixels, at all resolutions.
+    for nside in [1, 2, 4, 16, 128, 2 ** 20]:
+        pix = np.arange(min(nside2npix(nside), 100000))
+        if nside == 2 ** 20:
+            pix = np.random.RandomState(1).randint(0, nside2npix(nside), 100000)
+        alpha, delta = pix2ang(pix, nside)
+        assert alpha.min() >= 0 and alpha.max() < 2 * math.pi
+        assert np.abs(delta).max() <= math.pi / 2
+        assert (ang2pix(alpha, delta, nside) == pix).all()
+
+    # Pixels have equal areas, so uniformly distributed points fill them
+    # evenly; points in a pixel are in its parent at lower resolutions.
+    pa = _random_positions(120000, 7)
+    pix = ang2pix(pa.alpha.r, pa.delta.r, 4)
+    assert (pa.pixels(4) == pix).all()
+    counts = np.bincount(pix, minlength=192)
+    assert counts.min() > 500 and counts.max() < 750
+    assert (ang2pix(pa.alpha.r, pa.delta.r, 2) == pix // 4).all()
+    assert (ang2pix(pa.alpha.r, pa.delta.r, 1) == pix // 16).all()
+
+    # Unnormalized angles.
+    assert ang2pix(d2r(-10.0), d2r(10.0), 4) == ang2pix(d2r(350.0), d2r(10.0), 4)
+    assert ang2pix(d2r(10.0), d2r(100.0), 8) == ang2pix(d2r(190.0), d2r(80.0), 8)
+    assert ang2pix(d2r(10.0), d2r(100.0), 8) == \
+        AngularPositionArray([10.0], [100.0]).pixels(8)[0]
+    assert ang2pix(d2r(30.0), d2r(-260.0), 8) == ang2pix(d2r(30.0), d2r(100.0), 8)
+
+
+def test_cone_pixels():
+    np = pytest.importorskip("numpy")
+    pa = _random_positions(20000, 8)
+    pix = pa.pixels(32)
+    for alpha, delta, radius in [(0, 90, 3), (10, -45, 5), (359.5, 0, 2),
+                                 (180, -89.5, 20), (45, 41.8, 0.5)]:
+        p = AngularPosition(alpha=alpha, delta=delta)
+        cone = cone_pixels(p.alpha.r, p.delta.r, d2r(radius), 32)
+        assert (np.diff(cone) > 0).all()
+        inside = pa.sep(p) <= d2r(radius)
+        assert np.isin(pix[inside], cone).all()
+        # Only a band of pixels, at most a pixel wide, lies outside.
+        ca, cd = pix2ang(cone, 32)
+        s = sep_array(ca, cd, p.alpha.r, p.delta.r)
+        assert s.max() < d2r(radius) + 2 * math.sqrt(4 * math.pi / nside2npix(32))
+
+
+def _brute_force_crossmatch(cat1, cat2, radius):
+    import numpy as np
+    i1, i2, s = [], [], []
+    for i in range(len(cat1)):
+        d = cat2.sep(cat1[i])
+        j = np.nonzero(d <= radius)[0]
+        i1.extend([i] * len(j))
+        i2.extend(j)
+        s.extend(d[j])
+    i1, i2, s = np.array(i1, int), np.array(i2, int), np.array(s)
+    idx = np.lexsort((i2, s, i1))
+    return i1[idx], i2[idx], s[idx]
+
+
+def test_crossmatch_against_brute_force():
+    np = pytest.importorskip("numpy")
+    cat1 = _random_positions(1500, 3)
+    cat2 = _random_positions(3000, 4)
+    # Points around RA 0 and the poles.
+    extra = AngularPositionArray(
+        alpha=[0, 359.99, 0.005, 180, 90, 0, 359.999999],
+        delta=[0, 0.001, -0.002, 89.999, 89.99, -89.995, 30])
+    cat1 = AngularPositionArray.from_vectors(np.vstack([cat1.xyz, extra.xyz]))
+    cat2 = AngularPositionArray.from_vectors(np.vstack([cat2.xyz, extra.xyz[::-1]]))
+    for radius in [0.0, d2r(0.02), d2r(1.0), d2r(7.0)]:
+        i1, i2, s = _brute_force_crossmatch(cat1, cat2, radius)
+        j1, j2, t = crossmatch(cat1, cat2, radius, nearest=False, chunksize=500)
+        assert (i1 == j1).all() and (i2 == j2).all() and (s == t).all()
+        j1, j2, t = crossmatch(cat1, cat2, radius)
+        first = np.ones(len(i1), bool)
+        first[1:] = i1[1:] != i1[:-1]
+        assert (i1[first] == j1).all() and (i2[first] == j2).all()
+        assert (s[first] == t).all()
+
+    i1, i2, s = crossmatch([AngularPosition(alpha=10, delta=20)],
+                           [AngularPosition(alpha=10, delta=20.5)], d2r(1))
+    assert i1.tolist() == [0] and i2.tolist() == [0]
+    assert abs(s[0] - d2r(0.5)) < 1e-12
+    for nearest in [True, False]:
+        i1, i2, s = crossmatch(cat1, cat2, d2r(3.0), nearest=nearest)
+        j1, j2, t = crossmatch(cat1, cat2, d2r(3.0), nearest=nearest,
+                               chunksize=200, workers=3)
+        assert (i1 == j1).all() and (i2 == j2).all() and (s == t).all()
+
+    # A radius equal to a separation from AngularPosition.sep matches
+    # that pair, with that separation, also in worker processes.
+    for k in range(0, 1500, 100):
+        p, q = cat1[k], cat2[2 * k]
+        r = p.sep(q)
+        for workers in (1, 2):
+            i1, i2, s = crossmatch(cat1[k:k + 1], cat2[2 * k:2 * k + 1], r,
+                                   workers=workers, chunksize=1)
+            assert i1.tolist() == [0] and s.tolist() == [r]
+
+    assert len(crossmatch(cat1[:0], cat2, d2r(1))[0]) == 0
+    assert len(crossmatch(cat1, cat2[:0], d2r(1))[0]) == 0
+    with pytest.raises(ValueError):
+        crossmatch(cat1, cat2, -1.0)
+    with pytest.raises(ValueError):
+        crossmatch(cat1, cat2, 1.0, workers=0)
+
+
+def test_sep_matrix(tmpdir):
+    np = pytest.importorskip("numpy")
+    p1 = _random_positions(70, 5)
+    p2 = _random_positions(50, 6)
+    # Points very close to, and almost opposite to, points in p1.
+    close = AngularPositionArray(alpha=[10, 10 + 1e-9, 190], delta=[20, 20, -20 + 1e-9])
+    p1 = AngularPositionArray.from_vectors(np.vstack([p1.xyz, close.xyz]))
+    p2 = AngularPositionArray.from_vectors(np.vstack([p2.xyz, close.xyz]))
+    expected = np.array([p2.sep(p1[i]) for i in range(len(p1))])
+
+    s = sep_matrix(p1, p2)
+    assert s.shape == (73, 53)
+    assert np.abs(s - expected).max() < 1e-14
+    far = np.abs(np.cos(expected)) > 0.9
+    assert (s[far] == expected[far]).all()
+    assert s[-3, -2] == expected[-3, -2] and 0 < s[-3, -2] < 1e-10
+
+    # Small blocks, and output into a memory mapped file.
+    out = np.memmap(str(tmpdir.join("sep.dat")), dtype=np.float64,
+                    mode="w+", shape=(73, 53))
+    r = sep_matrix(p1, p2, out=out, max_bytes=1000)
+    assert r is out
+    assert np.abs(out - s).max() < 1e-14
+    assert (out[far] == s[far]).all()
+
+    s = sep_matrix([AngularPosition(alpha=0, delta=0)],
+                   [AngularPosition(alpha=90, delta=0)])
+    assert abs(s[0, 0] - math.pi / 2) < 1e-15
+    assert sep_matrix(p1[:0], p2).shape == (0, 53)
+    with pytest.raises(ValueError):
+        sep_matrix(p1, p2, out=np.empty((53, 73)))
+
+    # The temporary memory stays within max_bytes, also when most of the
+    # separations are close to 0 or π.
+    tracemalloc = pytest.importorskip("tracemalloc")
+    rng = np.random.RandomState(0)
+    clustered = AngularPositionArray(rng.uniform(0, 5, 1000),
+                                     rng.uniform(-5, 5, 1000))
+    out = np.empty((1000, 1000))
+    for p in (_random_positions(1000, 7), clustered):
+        tracemalloc.start()
+        try:
+            sep_matrix(p, p, out=out, max_bytes=2 ** 20)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < 2 ** 20
+        assert (out == sep_matrix(p, p)).all()
+
+
+def test_reference_point_must_match_sep_and_bear():
+    import random
+    random.seed(11)
+    points = [(random.uniform(-7, 7), random.uniform(-2, 2)) for i in range(300)]
+    points += [(0.0, 0.0), (1.0, math.pi / 2), (1.0, 1.0), (4.0, -1.0)]
+    for a1, b1 in points[::10] + [(1.0, 1.0)]:
+        ref = ReferencePoint(a1, b1)
+        for a2, b2 in points:
+            assert ref.sep_to(a2, b2) == sep(a1, b1, a2, b2)
+            assert ref.bear_to(a2, b2) == bear(a1, b1, a2, b2)
+
+    p = AngularPosition(alpha=123.4, delta=-56.7)
+    q = AngularPosition(alpha=120.4, delta=-50.1)
+    ref = ReferencePoint.from_position(p)
+    assert ref.sep_to(q.alpha.r, q.delta.r) == p.sep(q)
+    assert ref.bear_to(q.alpha.r, q.delta.r) == p.bear(q)
+
+    ref = ReferencePoint(1.0, math.pi / 2)
+    assert ref.on_pole
+    with pytest.warns(UserWarning):
+        assert ref.bear_to(0.5, 0.5) == 0.0
+
+
+def test_reference_point_arrays():
+    np = pytest.importorskip("numpy")
+    rng = np.random.RandomState(12)
+    a2 = rng.uniform(0, 2 * math.pi, 1000)
+    b2 = np.arcsin(rng.uniform(-1, 1, 1000))
+    for a1, b1 in [(0.3, 0.4), (5.0, -1.2), (1.0, math.pi / 2)]:
+        ref = ReferencePoint(a1, b1)
+        assert (ref.sep_to(a2, b2) == sep_array(a1, b1, a2, b2)).all()
+        x, undefined = ref.bear_to(a2, b2)
+        y, u = bear_array(a1, b1, a2, b2)
+        assert (x == y).all() and (undefined == u).all()
+        assert undefined.all() == ref.on_pole
+    # NumPy scalars are treated as scalars.
+    ref = ReferencePoint(0.3, 0.4)
+    assert ref.sep_to(a2[0], b2[0]) == sep(0.3, 0.4, a2[0], b2[0])
+    for a, b in [(np.int64(1), np.int64(-1)), (np.float32(1.5), 0),
+                 (1, np.int32(0))]:
+        s = ref.sep_to(a, b)
+        assert isinstance(s, float) and s == sep(0.3, 0.4, a, b)
+        x = ref.bear_to(a, b)
+        assert isinstance(x, float) and x == bear(0.3, 0.4, a, b)
+    assert ref.sep_to(np.array([1.0]), 0.5).shape == (1,)
+
+
+def test_vector_kernels_must_match_cartesian_vector():
+    import random
+    random.seed(13)
+    for i in range(2000):
+        a1, a2 = random.uniform(-7, 7), random.uniform(-7, 7)
+        b1, b2 = random.uniform(-2, 2), random.uniform(-2, 2)
+        v1, v2 = unit_vector(a1, b1), unit_vector(a2, b2)
+        c1 = CartesianVector.from_spherical(1.0, a1, b1)
+        assert v1 == (c1.x, c1.y, c1.z)
+        assert sep_vec(v1, v2) == sep(a1, b1, a2, b2)
+        assert bear_vec(v1, v2) == bear(a1, b1, a2, b2)
+
+        # Same steps with CartesianVector objects.
+        c2 = CartesianVector.from_spherical(1.0, a2, b2)
+        s = math.atan2(c1.cross(c2).mod, c1.dot(c2))
+        assert sep_vec(v1, v2) == (0.0 if abs(s) < 1e-15 else s)
+
+    assert sep_vec(v1, v1) == 0.0
+    with pytest.warns(UserWarning):
+        assert bear_vec(unit_vector(0.0, math.pi / 2), v2) == 0.0
+
+
+def test_format_cache():
+    import angles
+    c = FormatCache(maxsize=3)
+    values = [12.348978659, -23.99999999, 0.0, 89.9999999]
+    for v in values * 2:
+        for kw in [{}, dict(pre=1, trunc=True), dict(s1=":", s2=":", lower=0, upper=24,
+                                                     upper_trim=True)]:
+            assert c.fmt_angle(v, **kw) == fmt_angle(v, **kw)
+    assert c.info() == dict(hits=0, misses=24, maxsize=3, currsize=3)
+
+    # Least recently used entries are dropped.
+    c.clear()
+    assert c.info() == dict(hits=0, misses=0, maxsize=3, currsize=0)
+    for v in [1.0, 2.0, 3.0, 1.0, 4.0, 1.0, 2.0]:
+        c.fmt_angle(v)
+    assert c.info() == dict(hits=2, misses=5, maxsize=3, currsize=3)
+    with pytest.raises(ValueError):
+        FormatCache(0)
+
+    # Used by angle objects when enabled.
+    try:
+        cache = angles.enable_format_cache(100)
+        p = [AngularPosition(alpha=10.5, delta=-20.25) for i in range(5)]
+        s = [str(i) for i in p]
+        assert s == ["+00HH 42MM 00.000SS -20DD 15MM 00.000SS"] * 5
+        assert cache.info()["misses"] == 2 and cache.info()["hits"] == 8
+        a = DeltaAngle(d=-20.25)
+        a.pre = 1
+        assert str(a) == "-20DD 15MM 00.0SS"
+        assert str(Angle(d=-20.25)) == "-20 15 00.000"
+        assert cache.info()["misses"] == 4
+    finally:
+        angles.disable_format_cache()
+    assert str(AlphaAngle(h=1.5)) == "+01HH 30MM 00.000SS"
+    assert cache.info()["misses"] == 4